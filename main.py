@@ -1,17 +1,99 @@
+import os
 import streamlit as st
 import pandas as pd
-import json
-from src.utils.functions import selectbox_with_a_placeholder,read_csv_file, filter_dataframe_by_a_value, chain_string_to_dict
+from typing import Dict, Tuple
+from src.utils.functions import selectbox_with_a_placeholder, filter_dataframe_by_a_value, chain_string_to_dict, search_selectbox_with_a_placeholder
+from src.utils.loading import TABLE_DTYPES, read_csv_files_in_parallel
 from src.login.core import PrincipalLogin
 from src.access.access_pipeline import AccessPipeline
+from src.access.permission_engine import PermissionEngine
 from src.dynamic_form.form import PrincipalForm
+from src.sync.kpi_store import KPIDataStore
+from src.search.kpi_search_index import KPISearchIndex
+from src.table_view.paged_table import PagedTable
+
+# The tables read from disk on each change; KPI_Data is loaded by the KPI data store.
+TABLE_NAMES = ['KPI_Info', 'Role_Security', 'User_Security_Test']
+
+def get_modified_times()->Tuple[float, ...]:
+    """
+    Retrieves the modification time of each table file, used as the cache key of load_tables.
+
+    Returns:
+        Tuple[float, ...]: The modification times, in the order of TABLE_NAMES.
+    """
+    return tuple(os.path.getmtime(f'data/{table_name}.csv') for table_name in TABLE_NAMES)
+
+@st.cache_resource(max_entries=1)
+def load_tables(modified_times:Tuple[float, ...])->Dict[str, pd.DataFrame]:
+    """
+    Loads KPI_Info, Role_Security and User_Security_Test concurrently and reports the load time of each one.
+    They are loaded again whenever one of the files changes, e.g. after a schema migration updates KPI_Info.
+
+    Args:
+        modified_times (Tuple[float, ...]): The modification times of the table files, used as the cache key.
+
+    Returns:
+        Dict[str, pd.DataFrame]: The DataFrame of each table, by table name.
+    """
+    tables = {table_name: {'path': f'data/{table_name}.csv', 'dtype': TABLE_DTYPES[table_name]} for table_name in TABLE_NAMES}
+    dataframes, load_times = read_csv_files_in_parallel(tables = tables, delimiter='|')
+
+    for table_name, seconds in load_times.items():
+        print(f'Loaded {table_name} in {seconds:.3f} seconds')
+    return dataframes
+
+@st.cache_resource
+def get_kpi_data_store()->KPIDataStore:
+    """
+    Creates the KPI data store shared by every session of this process.
+
+    Returns:
+        KPIDataStore: The KPI data store, kept in sync with the other processes through the change log.
+    """
+    return KPIDataStore.from_files(kpi_data_path = 'data/KPI_Data.csv', change_log_path = 'data/kpi_changes.db')
+
+@st.cache_resource(max_entries=1)
+def get_kpi_search_index(kpi_info_version:float, _kpi_data:pd.DataFrame, _kpi_info:pd.DataFrame)->KPISearchIndex:
+    """
+    Builds the KPI search index once per version of the KPI information. The KPI names and IDs of the 
+    KPI data never change, since edits only update KPI_Values.
+
+    Args:
+        kpi_info_version (float): The modification time of the KPI_Info file, used as the cache key.
+        _kpi_data (pd.DataFrame): DataFrame containing KPI data (not hashed by the cache).
+        _kpi_info (pd.DataFrame): DataFrame containing KPI information (not hashed by the cache).
+
+    Returns:
+        KPISearchIndex: The search index over the KPI names, IDs and metadata field names.
+    """
+    return KPISearchIndex(kpi_data_dataframe = _kpi_data, kpi_info_dataframe = _kpi_info)
+
+@st.cache_resource(max_entries=1)
+def get_permission_engine(role_security_version:float, _role_security:pd.DataFrame, _kpi_data:pd.DataFrame)->PermissionEngine:
+    """
+    Compiles the role bitsets once per version of the role security data. The KPI IDs of the KPI data 
+    never change, since edits only update KPI_Values.
+
+    Args:
+        role_security_version (float): The modification time of the Role_Security file, used as the cache key.
+        _role_security (pd.DataFrame): DataFrame containing role security information (not hashed by the cache).
+        _kpi_data (pd.DataFrame): DataFrame containing KPI data (not hashed by the cache).
+
+    Returns:
+        PermissionEngine: The permission engine over the KPI IDs of the KPI data.
+    """
+    return PermissionEngine(role_security_dataframe = _role_security, kpi_data_dataframe = _kpi_data)
 
 def main():
    
-    kpi_data = read_csv_file('data/KPI_Data.csv',delimiter='|')
-    kp_info = read_csv_file('data/KPI_Info.csv',delimiter='|')
-    role_securty = read_csv_file('data/Role_Security.csv',delimiter='|')
-    user_security = read_csv_file('data/User_Security_Test.csv',delimiter='|')
+    modified_times = dict(zip(TABLE_NAMES, get_modified_times()))
+    tables = load_tables(modified_times = tuple(modified_times.values()))
+    kpi_data_store = get_kpi_data_store()
+    kpi_data = kpi_data_store.refresh()
+    kp_info = tables['KPI_Info']
+    role_securty = tables['Role_Security']
+    user_security = tables['User_Security_Test']
 
     principal_login = PrincipalLogin(user_securty_dataframe = user_security)
 
@@ -19,11 +101,11 @@ def main():
 
     if validator:
 
-        role_id = principal_login.get_RoleID(user_email = user_email)
+        role_ids = principal_login.get_RoleIDs(user_email = user_email)
 
         selection = st.selectbox(
             label='Select an Action',
-            options=['Update KPIs', 'Enter new value to KPIs'],
+            options=['Update KPIs', 'Browse KPIs', 'Enter new value to KPIs'],
             index=None,
             placeholder="Action ..."
         )
@@ -32,18 +114,28 @@ def main():
 
             case 'Update KPIs':
               
-              access_pipeline = AccessPipeline(role_id = role_id,
+              permission_engine = get_permission_engine(role_security_version = modified_times['Role_Security'],
+                                                        _role_security = role_securty,
+                                                        _kpi_data = kpi_data)
+              access_pipeline = AccessPipeline(role_id = role_ids,
                                                 role_security_dataframe = role_securty,
-                                                kpi_data_dataframe = kpi_data)
+                                                kpi_data_dataframe = kpi_data,
+                                                permission_engine = permission_engine)
               manipulate_data = access_pipeline.execute()
 
              
-              kpi_selected = selectbox_with_a_placeholder(dataframe = manipulate_data, 
-                                                       column_name = 'KPI',
-                                                       label='Select a KPI',
-                                                       placeholder = 'Place select a KPI ...')
+              kpi_search_index = get_kpi_search_index(kpi_info_version = modified_times['KPI_Info'],
+                                                      _kpi_data = kpi_data,
+                                                      _kpi_info = kp_info)
+              kpi_selected = search_selectbox_with_a_placeholder(search_index = kpi_search_index,
+                                                                 allowed_values = set(manipulate_data['KPI'].unique()),
+                                                                 label='Select a KPI',
+                                                                 placeholder = 'Place select a KPI ...')
+
+              if kpi_selected in kpi_data_store.change_log.get_migrating_kpis():
+                  st.warning(f'{kpi_selected} is being migrated to a new Meta_Data. It can be edited again once the migration finishes.')
 
-              if kpi_selected:
+              elif kpi_selected:
                   
                   filtered_manipulate_data = filter_dataframe_by_a_value(dataframe = manipulate_data,
                                                                          column_name = 'KPI',
@@ -64,10 +156,32 @@ def main():
 
                       if output_dict:
                           with st.spinner('Updating KPI data... Please wait.'):
-                              kpi_data.loc[(kpi_data['KPI'] == kpi_selected) & (kpi_data['KPI_Value_Date'] == date_selected), 'KPI_Values'] = json.dumps(output_dict)
-                              kpi_data.to_csv('data/KPI_Data.csv', sep='|')
-                              st.success('KPI data updated successfully!')
+                              try:
+                                  kpi_data_store.update_kpi_values(kpi = kpi_selected,
+                                                                   kpi_value_date = date_selected,
+                                                                   kpi_values = output_dict,
+                                                                   path = 'data/KPI_Data.csv')
+                                  st.success('KPI data updated successfully!')
+                              except ValueError as e:
+                                  # A migration of the KPI started after the form was displayed.
+                                  st.error(str(e))
              
+            case 'Browse KPIs':
+
+              permission_engine = get_permission_engine(role_security_version = modified_times['Role_Security'],
+                                                        _role_security = role_securty,
+                                                        _kpi_data = kpi_data)
+              access_pipeline = AccessPipeline(role_id = role_ids,
+                                                role_security_dataframe = role_securty,
+                                                kpi_data_dataframe = kpi_data,
+                                                permission_engine = permission_engine)
+              manipulate_data = access_pipeline.execute()
+
+              paged_table = PagedTable(dataframe = manipulate_data,
+                                       data_version = (kpi_data_store.version, modified_times['Role_Security'], tuple(role_ids)),
+                                       key = 'browse_kpis')
+              paged_table.show()
+
             case 'Enter new value to KPIs':
                 
                 st.write('TO DO')
@@ -1,5 +1,7 @@
+import streamlit as st
 import pandas as pd
-from .access_data import AccessData
+from typing import List, Optional, Union
+from .permission_engine import PermissionEngine
 from src.utils.functions import chain_string_to_dict,filter_dataframe_by_a_value
 
 class AccessPipeline:
@@ -9,12 +11,13 @@ class AccessPipeline:
     for specific KPIs based on the user's role.
 
     Attributes:
-        role_id (int): The ID of the user role.
+        role_id (Union[int, List[int]]): The ID of the user role, or the list of IDs when the user has several roles.
         role_security_dataframe (pd.DataFrame): DataFrame containing role security information.
         kpi_data_dataframe (pd.DataFrame): DataFrame containing KPI data.
+        permission_engine (PermissionEngine): The compiled role bitsets; compiled from the dataframes when not provided.
 
     Methods:
-        __init__(role_id: int, role_security_dataframe: pd.DataFrame, kpi_data_dataframe: pd.DataFrame) -> None:
+        __init__(role_id: Union[int, List[int]], role_security_dataframe: pd.DataFrame, kpi_data_dataframe: pd.DataFrame, permission_engine: Optional[PermissionEngine]) -> None:
             Initializes the AccessPipeline with role ID and dataframes.
             
         execute() -> pd.DataFrame:
@@ -24,10 +27,13 @@ class AccessPipeline:
             Retrieves the input template for a specific KPI.
     """
 
-    def __init__(self,role_id:int, role_security_dataframe:pd.DataFrame, kpi_data_dataframe:pd.DataFrame)->None:
+    def __init__(self,role_id:Union[int, List[int]], role_security_dataframe:pd.DataFrame, kpi_data_dataframe:pd.DataFrame, permission_engine:Optional[PermissionEngine]=None)->None:
         self.role_id = role_id
         self.role_security_dataframe = role_security_dataframe
         self.kpi_data_dataframe = kpi_data_dataframe
+        # Compile the roles here when no shared engine is given, so wildcards, revocations and inheritance always apply.
+        self.permission_engine = permission_engine or PermissionEngine(role_security_dataframe = role_security_dataframe,
+                                                                       kpi_data_dataframe = kpi_data_dataframe)
 
     def execute(self)->pd.DataFrame:
         """
@@ -36,16 +42,11 @@ class AccessPipeline:
         Returns:
             pd.DataFrame: A DataFrame containing the interactable KPIs.
         """
-        # Create an instance of AccessData with the given role ID.
-        access_data = AccessData(role_id = self.role_id)
+        role_ids = self.role_id if isinstance(self.role_id, list) else [self.role_id]
+        st.write(f'Your currect role is: {", ".join(self.permission_engine.get_role_names(role_ids = role_ids))}')
 
-        # Get the list of KPIs associated with the role from the role security dataframe.
-        interact_kpis_list = access_data.get_list_kpis_from_role(role_security_dataframe = self.role_security_dataframe)
-
-        # Retrieve the interactable KPI dataframe based on the KPIs list and the KPI data dataframe.
-        interactable_kips_dataframe =  access_data.get_interactable_kips_dataframe(kpis_list_from_role = interact_kpis_list,
-                                                                              kpi_data_dataframe = self.kpi_data_dataframe)
-        return interactable_kips_dataframe
+        # Filter the KPI data with the single boolean mask resolved from every role of the user.
+        return self.kpi_data_dataframe[self.permission_engine.get_row_mask(role_ids = role_ids)]
     
     def get_input_template(self,kpi_info_dataframe:pd.DataFrame, kpi:str)->dict:
         """
@@ -0,0 +1,166 @@
+import fnmatch
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Tuple
+from src.utils.functions import chain_string_to_list
+
+class PermissionEngine:
+    """
+    The PermissionEngine class compiles the roles into boolean bitsets over a dense numbering of the KPI IDs, 
+    so the KPIs a user can access are resolved with vectorized OR/AND operations instead of list lookups.
+
+    Each entry of a role's KPIs list is either a KPI ID, a wildcard pattern (e.g. "*" or "KPI1_*") or a 
+    revocation prefixed with "!" (e.g. "!KPI3_*"). When the role security dataframe has an 'Inherits' column, 
+    it holds the list of RoleIDs whose KPIs are inherited by the role.
+
+    Attributes:
+        role_security_dataframe (pd.DataFrame): DataFrame containing role security information.
+        kpi_data_dataframe (pd.DataFrame): DataFrame containing KPI data.
+        kpi_id_index (pd.Index): The unique KPI IDs; the position of each one is its dense number.
+        kpi_ids (np.ndarray): The unique KPI IDs as an array.
+        row_codes (np.ndarray): The dense number of the KPI ID of each row of the KPI data.
+        role_positions (Dict[int, int]): A mapping from each RoleID to its row in the role masks.
+        role_names (Dict[int, str]): A mapping from each RoleID to its role name.
+        role_masks (np.ndarray): A boolean matrix (roles x KPI IDs) with the effective KPIs of each role.
+
+    Methods:
+        __init__(role_security_dataframe: pd.DataFrame, kpi_data_dataframe: pd.DataFrame) -> None:
+            Initializes the PermissionEngine and compiles the role masks.
+
+        get_role_names(role_ids: List[int]) -> List[str]:
+            Retrieves the names of the given roles.
+
+        get_kpi_mask(role_ids: List[int]) -> np.ndarray:
+            Retrieves the boolean mask over the KPI IDs that the given roles can access.
+
+        get_row_mask(role_ids: List[int]) -> np.ndarray:
+            Retrieves the boolean mask over the KPI data rows that the given roles can access.
+
+        has_access(role_ids: List[int], kpi_id: str) -> bool:
+            Checks whether the given roles can access a KPI ID.
+    """
+
+    def __init__(self, role_security_dataframe:pd.DataFrame, kpi_data_dataframe:pd.DataFrame)->None:
+        self.role_security_dataframe = role_security_dataframe
+        self.kpi_data_dataframe = kpi_data_dataframe
+
+        # Number the KPI IDs densely and map each KPI data row to the number of its KPI ID.
+        self.kpi_id_index = pd.Index(kpi_data_dataframe['KPI_Id'].unique())
+        self.kpi_ids = self.kpi_id_index.to_numpy()
+        self.row_codes = self.kpi_id_index.get_indexer(kpi_data_dataframe['KPI_Id'])
+
+        self.role_positions = {int(role_id): position for position, role_id in enumerate(role_security_dataframe['RoleID'])}
+        self.role_names = dict(zip(role_security_dataframe['RoleID'].astype(int), role_security_dataframe['Role']))
+        self.role_masks = self._compile()
+
+    def _match(self, pattern:str)->np.ndarray:
+        # Vectorized match of a KPI ID or a wildcard pattern against every KPI ID.
+        if any(character in pattern for character in '*?['):
+            return pd.Series(self.kpi_ids, dtype=str).str.match(fnmatch.translate(pattern)).to_numpy()
+        return self.kpi_ids == pattern
+
+    def _compile_direct(self, kpis:str)->Tuple[np.ndarray, np.ndarray]:
+        # Build the grant and revoke masks declared directly on a role.
+        grants = np.zeros(len(self.kpi_ids), dtype=bool)
+        revokes = np.zeros(len(self.kpi_ids), dtype=bool)
+        for entry in chain_string_to_list(chain = kpis):
+            if entry.startswith('!'):
+                revokes |= self._match(pattern = entry[1:])
+            else:
+                grants |= self._match(pattern = entry)
+        return grants, revokes
+
+    def _compile(self)->np.ndarray:
+        direct_masks = {}
+        parents = {}
+        has_inheritance = 'Inherits' in self.role_security_dataframe.columns
+
+        for row in self.role_security_dataframe.itertuples(index=False):
+            role_id = int(row.RoleID)
+            direct_masks[role_id] = self._compile_direct(kpis = row.KPIs)
+            inherits = row.Inherits if has_inheritance else None
+            parents[role_id] = [int(parent) for parent in chain_string_to_list(chain = inherits)] if isinstance(inherits, str) else []
+
+        role_masks = np.zeros((len(self.role_positions), len(self.kpi_ids)), dtype=bool)
+        resolved = set()
+
+        def resolve(role_id:int, path:Tuple[int, ...])->np.ndarray:
+            if role_id not in direct_masks:
+                raise ValueError(f"The RoleID '{role_id}' inherited by the RoleID '{path[-1]}' does not exist.")
+            if role_id in path:
+                raise ValueError(f"The role inheritance has a cycle: {' -> '.join(map(str, path + (role_id,)))}.")
+
+            position = self.role_positions[role_id]
+            if role_id not in resolved:
+                grants, revokes = direct_masks[role_id]
+                effective = grants.copy()
+                for parent in parents[role_id]:
+                    effective |= resolve(role_id = parent, path = path + (role_id,))
+                # The role's own revocations apply after the inherited grants.
+                role_masks[position] = effective & ~revokes
+                resolved.add(role_id)
+            return role_masks[position]
+
+        for role_id in direct_masks:
+            resolve(role_id = role_id, path = ())
+
+        return role_masks
+
+    def _get_positions(self, role_ids:List[int])->List[int]:
+        missing_role_ids = [role_id for role_id in role_ids if role_id not in self.role_positions]
+        if missing_role_ids:
+            raise ValueError(f"The RoleIDs {missing_role_ids} do not exist in the role security data.")
+        return [self.role_positions[role_id] for role_id in role_ids]
+
+    def get_role_names(self, role_ids:List[int])->List[str]:
+        """
+        Retrieves the names of the given roles.
+
+        Args:
+            role_ids (List[int]): The Role IDs of the user.
+
+        Returns:
+            List[str]: The names of the roles.
+        """
+        self._get_positions(role_ids = role_ids)
+        return [self.role_names[role_id] for role_id in role_ids]
+
+    def get_kpi_mask(self, role_ids:List[int])->np.ndarray:
+        """
+        Retrieves the boolean mask over the KPI IDs that the given roles can access.
+
+        Args:
+            role_ids (List[int]): The Role IDs of the user.
+
+        Returns:
+            np.ndarray: A boolean array aligned with kpi_ids, True for every accessible KPI ID.
+        """
+        # A user can access a KPI if any of the roles grants it.
+        return self.role_masks[self._get_positions(role_ids = role_ids)].any(axis=0)
+
+    def get_row_mask(self, role_ids:List[int])->np.ndarray:
+        """
+        Retrieves the boolean mask over the KPI data rows that the given roles can access.
+
+        Args:
+            role_ids (List[int]): The Role IDs of the user.
+
+        Returns:
+            np.ndarray: A boolean array aligned with the rows of the KPI data.
+        """
+        return self.get_kpi_mask(role_ids = role_ids)[self.row_codes]
+
+    def has_access(self, role_ids:List[int], kpi_id:str)->bool:
+        """
+        Checks whether the given roles can access a KPI ID.
+
+        Args:
+            role_ids (List[int]): The Role IDs of the user.
+            kpi_id (str): The KPI ID to check.
+
+        Returns:
+            bool: True if any of the roles can access the KPI ID, False otherwise.
+        """
+        if kpi_id not in self.kpi_id_index:
+            return False
+        return bool(self.role_masks[self._get_positions(role_ids = role_ids), self.kpi_id_index.get_loc(kpi_id)].any())
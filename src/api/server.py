@@ -0,0 +1,385 @@
+import os
+import hmac
+import json
+import functools
+import argparse
+import threading
+import ipaddress
+import numpy as np
+import pandas as pd
+import tornado.ioloop
+import tornado.web
+from typing import Any, Dict, List, Optional, Tuple
+from src.utils.functions import chain_string_to_dict, get_list_unique_values_from_dataframe
+from src.utils.loading import TABLE_DTYPES, read_csv_files_in_parallel
+from src.login.core import PrincipalLogin
+from src.access.access_pipeline import AccessPipeline
+from src.access.permission_engine import PermissionEngine
+from src.sync.kpi_store import KPIDataStore
+
+# The Python types accepted for each data type of the KPI_Info metadata.
+METADATA_TYPES = {
+    'int': (int,),
+    'decimal': (int, float),
+    'float': (int, float),
+    'str': (str,),
+}
+
+def validate_kpi_values(metadata_dict:dict, kpi_values:Any)->List[str]:
+    """
+    Validates KPI values against the metadata of the KPI.
+
+    Args:
+        metadata_dict (dict): The input template of the KPI, mapping each field to its data type.
+        kpi_values (Any): The values to validate.
+
+    Returns:
+        List[str]: The validation errors, empty if the values are valid.
+    """
+    if not isinstance(kpi_values, dict):
+        return ['KPI_Values must be a JSON object.']
+
+    errors = [f"The field '{field}' is missing." for field in metadata_dict if field not in kpi_values]
+    errors += [f"The field '{field}' is not part of the KPI metadata." for field in kpi_values if field not in metadata_dict]
+
+    for field, data_type in metadata_dict.items():
+        if field not in kpi_values:
+            continue
+        value = kpi_values[field]
+        if data_type not in METADATA_TYPES:
+            errors.append(f"The data type '{data_type}' of the field '{field}' is not recognized.")
+        elif isinstance(value, bool) or not isinstance(value, METADATA_TYPES[data_type]):
+            errors.append(f"The field '{field}' must be of type '{data_type}'.")
+    return errors
+
+
+class KPIService:
+    """
+    The KPIService class holds the data shared by every request of the API: the KPI data store, 
+    the KPI information, the user security data and the permission engine.
+
+    KPI_Info, Role_Security and User_Security_Test are loaded again when their files change. The permission 
+    engine and the row mask of each set of roles are built once per load of those tables, since edits only 
+    update KPI_Values and never add, remove or move rows. The rows are found through the key index of the store.
+
+    Attributes:
+        kpi_data_store (KPIDataStore): The KPI data store, kept in sync with the app processes through the change log.
+        kpi_data_path (str): The file path of the KPI data CSV file.
+        table_paths (Dict[str, str]): The file paths of KPI_Info, Role_Security and User_Security_Test.
+        kpi_info_dataframe (pd.DataFrame): DataFrame containing KPI information.
+        role_security_dataframe (pd.DataFrame): DataFrame containing role security information.
+        principal_login (PrincipalLogin): The login used to authorize the users and retrieve their roles.
+        permission_engine (PermissionEngine): The compiled role bitsets over the KPI data.
+
+    Methods:
+        __init__(kpi_data_store: KPIDataStore, kpi_data_path: str, table_paths: Dict[str, str]) -> None:
+            Initializes the KPIService and loads the tables.
+
+        get_role_ids(user_email: str) -> List[int]:
+            Retrieves the Role IDs of an authorized user.
+
+        fetch(role_ids: List[int], items: List[dict]) -> List[dict]:
+            Retrieves the values of many (KPI, KPI_Value_Date) pairs.
+
+        upsert(role_ids: List[int], rows: List[dict]) -> List[dict]:
+            Validates and saves many KPI values in a single transaction.
+    """
+
+    def __init__(self, kpi_data_store:KPIDataStore, kpi_data_path:str, table_paths:Dict[str, str])->None:
+        self.kpi_data_store = kpi_data_store
+        self.kpi_data_path = kpi_data_path
+        self.table_paths = table_paths
+        self.modified_times = None
+        # The requests run in executor threads, so the tables and the row masks are swapped under a lock.
+        self.lock = threading.Lock()
+        self._reload_tables_if_changed()
+
+    def _reload_tables_if_changed(self)->None:
+        with self.lock:
+            self._reload_tables()
+
+    def _reload_tables(self)->None:
+        modified_times = {table_name: os.path.getmtime(path) for table_name, path in self.table_paths.items()}
+        if modified_times == self.modified_times:
+            return
+
+        tables, load_times = read_csv_files_in_parallel(tables = {table_name: {'path': path, 'dtype': TABLE_DTYPES[table_name]}
+                                                                  for table_name, path in self.table_paths.items()})
+        for table_name, seconds in load_times.items():
+            print(f'Loaded {table_name} in {seconds:.3f} seconds')
+
+        self.kpi_info_dataframe = tables['KPI_Info']
+        self.role_security_dataframe = tables['Role_Security']
+        self.principal_login = PrincipalLogin(user_securty_dataframe = tables['User_Security_Test'])
+        self.emails = set(get_list_unique_values_from_dataframe(dataframe = tables['User_Security_Test'], column_name = 'UserName'))
+        self.permission_engine = PermissionEngine(role_security_dataframe = self.role_security_dataframe,
+                                                  kpi_data_dataframe = self.kpi_data_store.kpi_data_dataframe)
+        self.row_masks = {}
+        self.input_templates = {}
+        self.modified_times = modified_times
+
+    def get_role_ids(self, user_email:str)->List[int]:
+        """
+        Retrieves the Role IDs of an authorized user.
+
+        Args:
+            user_email (str): The email of the user.
+
+        Returns:
+            List[int]: The Role IDs of the user.
+
+        Raises:
+            tornado.web.HTTPError: If the user is not authorized.
+        """
+        self._reload_tables_if_changed()
+        if user_email not in self.emails:
+            raise tornado.web.HTTPError(403, reason = "You don't have access to this Application")
+        return self.principal_login.get_RoleIDs(user_email = user_email)
+
+    def _get_access_pipeline(self, role_ids:List[int])->AccessPipeline:
+        return AccessPipeline(role_id = role_ids,
+                              role_security_dataframe = self.role_security_dataframe,
+                              kpi_data_dataframe = self.kpi_data_store.refresh(),
+                              permission_engine = self.permission_engine)
+
+    def _get_accessible_positions(self, role_ids:List[int], keys:pd.MultiIndex)->np.ndarray:
+        # Find the row of each (KPI, KPI_Value_Date) key, or -1 if it does not exist or the roles cannot access it.
+        role_key = tuple(sorted(role_ids))
+        with self.lock:
+            if role_key not in self.row_masks:
+                # The row mask is used directly, since AccessPipeline.execute also writes the role to the Streamlit page.
+                self.row_masks[role_key] = self.permission_engine.get_row_mask(role_ids = role_ids)
+            row_mask = self.row_masks[role_key]
+
+        positions = self.kpi_data_store.get_row_positions(keys = keys)
+        return np.where((positions >= 0) & row_mask[positions], positions, -1)
+
+    def _get_input_template(self, access_pipeline:AccessPipeline, kpi:str)->Optional[dict]:
+        # None when the KPI has no KPI_Info row or its Meta_Data cannot be parsed.
+        if kpi not in self.input_templates:
+            try:
+                self.input_templates[kpi] = access_pipeline.get_input_template(kpi_info_dataframe = self.kpi_info_dataframe, kpi = kpi)
+            except Exception:
+                self.input_templates[kpi] = None
+        return self.input_templates[kpi]
+
+    @staticmethod
+    def _get_fetch_result(kpi:str, kpi_value_date:str, kpi_values:Any)->dict:
+        result = {'KPI': kpi, 'KPI_Value_Date': kpi_value_date, 'KPI_Values': None}
+        if isinstance(kpi_values, str):
+            try:
+                result['KPI_Values'] = chain_string_to_dict(chain = kpi_values)
+            except Exception:
+                result['error'] = 'The stored KPI_Values cannot be parsed.'
+        return result
+
+    def fetch(self, role_ids:List[int], items:List[dict])->List[dict]:
+        """
+        Retrieves the values of many (KPI, KPI_Value_Date) pairs.
+
+        Args:
+            role_ids (List[int]): The Role IDs of the user.
+            items (List[dict]): The requested pairs, each one with the keys 'KPI' and 'KPI_Value_Date'.
+
+        Returns:
+            List[dict]: One result per requested pair, with 'KPI_Values' set to None when the pair 
+            does not exist or the user cannot access it. When the stored KPI_Values cannot be parsed, 
+            they are also None and the result has an 'error'.
+        """
+        if not items:
+            return []
+
+        access_pipeline = self._get_access_pipeline(role_ids = role_ids)
+        keys = pd.MultiIndex.from_tuples([(item['KPI'], item['KPI_Value_Date']) for item in items])
+        positions = self._get_accessible_positions(role_ids = role_ids, keys = keys)
+        all_kpi_values = access_pipeline.kpi_data_dataframe['KPI_Values'].to_numpy()
+        found_values = [all_kpi_values[position] if position >= 0 else None for position in positions]
+
+        return [self._get_fetch_result(kpi = kpi, kpi_value_date = kpi_value_date, kpi_values = kpi_values)
+                for (kpi, kpi_value_date), kpi_values in zip(keys, found_values)]
+
+    def upsert(self, role_ids:List[int], rows:List[dict])->List[dict]:
+        """
+        Validates and saves many KPI values in a single transaction: nothing is saved if any row is invalid.
+
+        Only existing (KPI, KPI_Value_Date) rows can be updated, since the KPI_Id of a new row and its 
+        access rules are not defined yet.
+
+        Args:
+            role_ids (List[int]): The Role IDs of the user.
+            rows (List[dict]): The rows to save, each one with the keys 'KPI', 'KPI_Value_Date' and 'KPI_Values'.
+
+        Returns:
+            List[dict]: The validation errors of each invalid row, empty if every row was saved.
+        """
+        if not rows:
+            return []
+
+        access_pipeline = self._get_access_pipeline(role_ids = role_ids)
+        positions = self._get_accessible_positions(role_ids = role_ids,
+                                                   keys = pd.MultiIndex.from_tuples([(row['KPI'], row['KPI_Value_Date']) for row in rows]))
+        migrating_kpis = self.kpi_data_store.change_log.get_migrating_kpis()
+        errors = []
+        updates: List[Tuple[str, str, dict]] = []
+
+        for position, row in enumerate(rows):
+            kpi, kpi_value_date = row['KPI'], row['KPI_Value_Date']
+            if positions[position] < 0:
+                errors.append({'row': position, 'errors': [f"The KPI '{kpi}' on '{kpi_value_date}' does not exist or you don't have access to it."]})
+                continue
+
+            if kpi in migrating_kpis:
+                errors.append({'row': position, 'errors': [f"The KPI '{kpi}' is being migrated to a new Meta_Data and cannot be edited until the migration finishes."]})
+                continue
+
+            input_template = self._get_input_template(access_pipeline = access_pipeline, kpi = kpi)
+            if input_template is None:
+                errors.append({'row': position, 'errors': [f"The KPI '{kpi}' has no valid Meta_Data in KPI_Info."]})
+                continue
+
+            row_errors = validate_kpi_values(metadata_dict = input_template, kpi_values = row.get('KPI_Values'))
+
+            if row_errors:
+                errors.append({'row': position, 'errors': row_errors})
+            else:
+                updates.append((kpi, kpi_value_date, row['KPI_Values']))
+
+        if not errors and updates:
+            try:
+                self.kpi_data_store.update_many_kpi_values(rows = updates, path = self.kpi_data_path)
+            except ValueError as e:
+                # A migration started after the check above; the store refused the whole batch.
+                migrating_kpis = self.kpi_data_store.change_log.get_migrating_kpis()
+                errors = ([{'row': position, 'errors': [str(e)]} for position, row in enumerate(rows) if row['KPI'] in migrating_kpis]
+                          or [{'row': position, 'errors': [str(e)]} for position in range(len(rows))])
+        return errors
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    """
+    Base handler that checks the shared token, parses the JSON body and authorizes the user given in the 
+    'X-User-Email' header. Malformed bodies are rejected with a 400 error.
+    """
+
+    def initialize(self, kpi_service:KPIService, token:Optional[str])->None:
+        self.kpi_service = kpi_service
+        self.token = token
+
+    def prepare(self)->None:
+        # The email header can only be trusted from callers that know the shared token.
+        if self.token and not hmac.compare_digest(self.request.headers.get('Authorization', ''), f'Bearer {self.token}'):
+            raise tornado.web.HTTPError(401, reason = 'A valid bearer token is required.')
+
+        # The user is identified by the email the authentication proxy in front of the API forwards.
+        user_email = self.request.headers.get('X-User-Email', '').lower()
+        self.role_ids = self.kpi_service.get_role_ids(user_email = user_email)
+        try:
+            self.body = json.loads(self.request.body or b'{}')
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise tornado.web.HTTPError(400, reason = f'The body is not valid JSON: {e}')
+        if not isinstance(self.body, dict):
+            raise tornado.web.HTTPError(400, reason = 'The body must be a JSON object.')
+
+    def get_key_list(self, name:str)->List[dict]:
+        """
+        Retrieves a list of objects from the body, each one with a string 'KPI' and 'KPI_Value_Date'.
+
+        Args:
+            name (str): The name of the list in the body.
+
+        Returns:
+            List[dict]: The objects of the list, empty if the body does not have it.
+
+        Raises:
+            tornado.web.HTTPError: If the list or any of its objects is malformed.
+        """
+        values = self.body.get(name, [])
+        if not isinstance(values, list):
+            raise tornado.web.HTTPError(400, reason = f"'{name}' must be a list.")
+        for position, value in enumerate(values):
+            if not isinstance(value, dict) or not all(isinstance(value.get(key), str) for key in ('KPI', 'KPI_Value_Date')):
+                raise tornado.web.HTTPError(400, reason = f"'{name}[{position}]' must be an object with the strings 'KPI' and 'KPI_Value_Date'.")
+        return values
+
+    def write_error(self, status_code:int, **kwargs:Any)->None:
+        self.finish({'error': self._reason})
+
+
+class FetchHandler(BaseHandler):
+    """
+    POST /kpis/values/fetch with {"items": [{"KPI": ..., "KPI_Value_Date": ...}, ...]}.
+    """
+
+    async def post(self)->None:
+        items = self.get_key_list(name = 'items')
+        values = await tornado.ioloop.IOLoop.current().run_in_executor(None, functools.partial(self.kpi_service.fetch, role_ids = self.role_ids, items = items))
+        self.write({'values': values})
+
+
+class UpsertHandler(BaseHandler):
+    """
+    POST /kpis/values/upsert with {"rows": [{"KPI": ..., "KPI_Value_Date": ..., "KPI_Values": {...}}, ...]}.
+    """
+
+    async def post(self)->None:
+        rows = self.get_key_list(name = 'rows')
+        # The upsert waits for the write lock and saves the whole file, so it runs in a thread to keep the 
+        # IOLoop serving the other requests.
+        errors = await tornado.ioloop.IOLoop.current().run_in_executor(None, functools.partial(self.kpi_service.upsert, role_ids = self.role_ids, rows = rows))
+        if errors:
+            self.set_status(422)
+            self.write({'saved': 0, 'errors': errors})
+        else:
+            self.write({'saved': len(rows), 'errors': []})
+
+
+def make_app(kpi_service:KPIService, token:Optional[str]=None)->tornado.web.Application:
+    """
+    Creates the API application. Responses are gzip compressed and tornado keeps HTTP/1.1 connections alive.
+
+    Args:
+        kpi_service (KPIService): The service shared by every request.
+        token (Optional[str]): The shared token every request must send as 'Authorization: Bearer <token>', or None.
+
+    Returns:
+        tornado.web.Application: The API application.
+    """
+    return tornado.web.Application([
+        (r'/kpis/values/fetch', FetchHandler, {'kpi_service': kpi_service, 'token': token}),
+        (r'/kpis/values/upsert', UpsertHandler, {'kpi_service': kpi_service, 'token': token}),
+    ], compress_response = True)
+
+
+def main()->None:
+    """
+    Starts the API server, e.g.: KPI_API_TOKEN=... python -m src.api.server --port 8502
+    """
+    parser = argparse.ArgumentParser(description = 'Headless batch API to read and write KPI values.')
+    parser.add_argument('--port', type = int, default = 8502)
+    parser.add_argument('--address', default = '127.0.0.1', help = 'The address to listen on (default is only this host).')
+    parser.add_argument('--token', default = os.environ.get('KPI_API_TOKEN'), help = 'The shared bearer token (default is $KPI_API_TOKEN).')
+    parser.add_argument('--kpi-data', default = 'data/KPI_Data.csv')
+    parser.add_argument('--kpi-info', default = 'data/KPI_Info.csv')
+    parser.add_argument('--role-security', default = 'data/Role_Security.csv')
+    parser.add_argument('--user-security', default = 'data/User_Security_Test.csv')
+    parser.add_argument('--change-log', default = 'data/kpi_changes.db')
+    arguments = parser.parse_args()
+
+    # Anyone reaching the port could act as any user, so other hosts are only served with a token.
+    if not arguments.token and not (arguments.address == 'localhost' or ipaddress.ip_address(arguments.address).is_loopback):
+        parser.error('A --token (or KPI_API_TOKEN) is required to listen on a non-loopback address.')
+
+    kpi_data_store = KPIDataStore.from_files(kpi_data_path = arguments.kpi_data, change_log_path = arguments.change_log)
+    kpi_service = KPIService(kpi_data_store = kpi_data_store,
+                             kpi_data_path = arguments.kpi_data,
+                             table_paths = {'KPI_Info': arguments.kpi_info,
+                                            'Role_Security': arguments.role_security,
+                                            'User_Security_Test': arguments.user_security})
+
+    make_app(kpi_service = kpi_service, token = arguments.token).listen(arguments.port, address = arguments.address)
+    print(f'KPI API listening on {arguments.address}:{arguments.port}')
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == '__main__':
+    main()
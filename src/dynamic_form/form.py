@@ -1,5 +1,5 @@
 from .generate_inputs import InputGenerator
-from src.utils.functions import transform_dictionary_to_pandas
+from src.utils.functions import transform_dictionary_to_pandas, get_dictionary_differences
 import streamlit as st
 import copy
 
@@ -20,10 +20,10 @@ class PrincipalForm:
             Generates a dynamic form and captures user input.
 
         comparative_tables(dict_updated: dict) -> None:
-            Displays comparative tables of original and updated data.
+            Displays comparative tables of the fields that changed between original and updated data.
 
         show() -> dict:
-            Displays the form and handles user interactions.
+            Displays the form inside an st.form so field edits are batched until a submit button is pressed.
     """
 
     def __init__(self, metadata_dict:dict, original_dict:dict)->None:
@@ -64,14 +64,20 @@ class PrincipalForm:
     
     def comparative_tables(self,dict_updated)->None:
         """
-        Displays comparative tables of original and updated data.
+        Displays comparative tables of the fields that changed between original and updated data.
 
         Args:
             dict_updated (dict): A dictionary containing updated values for the input fields.
         """
+        # Only the changed fields are rendered, so the tables stay small for KPIs with many fields.
+        differences = get_dictionary_differences(original_dictionary = self.original_dict,
+                                                 updated_dictionary = dict_updated)
+        if not differences:
+            st.info('There are no changes to compare yet.')
+            return
 
-        original_dataframe = transform_dictionary_to_pandas(dictionary = self.original_dict)
-        updated_dataframe = transform_dictionary_to_pandas(dictionary = dict_updated)
+        original_dataframe = transform_dictionary_to_pandas(dictionary = {key: values[0] for key, values in differences.items()})
+        updated_dataframe = transform_dictionary_to_pandas(dictionary = {key: values[1] for key, values in differences.items()})
 
         # Create two columns for comparison.
         col1, col2 = st.columns(spec = 2)
@@ -90,6 +96,9 @@ class PrincipalForm:
         """
         Displays the form and handles user interactions.
 
+        The inputs are rendered inside an st.form, so typing in a field does not rerun the app;
+        the app only reruns when 'Preview changes' or 'Update KPI' is pressed.
+
         Returns:
             dict: A dictionary containing updated values from the input fields.
         """
@@ -97,27 +106,18 @@ class PrincipalForm:
         
             st.markdown('<h1 style="color: black; font-weight: bold;">Form to update a KPI</h1>', unsafe_allow_html=True)
 
-            dict_updated = self.dynamic_form()
-            
-            self.comparative_tables(dict_updated = dict_updated)
-
-            summited_button = st.button(label = 'Update KPI')
-
-            if summited_button:
-                return dict_updated
-            
-            
-            
-        
-            
-            
-
-            
-            
-
-        
-
+            # Batch the field edits until one of the submit buttons is pressed.
+            with st.form(key = 'principal_form', border = False):
 
+                dict_updated = self.dynamic_form()
 
+                col1, col2 = st.columns(spec = 2)
+                with col1:
+                    st.form_submit_button(label = 'Preview changes')
+                with col2:
+                    summited_button = st.form_submit_button(label = 'Update KPI')
 
+            self.comparative_tables(dict_updated = dict_updated)
 
+            if summited_button:
+                return dict_updated
@@ -1,5 +1,5 @@
 import pandas as pd
-from typing import Tuple
+from typing import List, Tuple
 from .email_validator import EmailValidator
 from src.utils.functions import get_list_unique_values_from_dataframe, filter_dataframe_by_a_value
 
@@ -18,6 +18,9 @@ class PrincipalLogin:
         
         get_RoleID(user_email: str) -> int:
             Retrieves the Role ID associated with the given user email from the DataFrame.
+
+        get_RoleIDs(user_email: str) -> List[int]:
+            Retrieves every Role ID associated with the given user email from the DataFrame.
     """
 
     def __init__(self, user_securty_dataframe:pd.DataFrame) -> None:
@@ -83,4 +86,26 @@ class PrincipalLogin:
                                                                       column_name = 'UserName',
                                                                       value = user_email)
         role_id = filtered_user_securty_dataframe['RoleID'].values
-        return int(role_id[0])
\ No newline at end of file
+        return int(role_id[0])
+
+    def get_RoleIDs(self, user_email: str) -> List[int]:
+        """
+        Retrieves every Role ID for a given user email.
+
+        This method filters the user security DataFrame to find all the Role IDs associated with the provided email,
+        since a user can have one row per role.
+
+        Args:
+        
+            user_email : str
+                The email of the user whose Role IDs are to be retrieved.
+
+        Returns:
+        
+            List[int]
+                The Role IDs of the user as integers, without duplicates.
+        """
+        filtered_user_securty_dataframe = filter_dataframe_by_a_value(dataframe = self.user_securty_dataframe,
+                                                                      column_name = 'UserName',
+                                                                      value = user_email)
+        return [int(role_id) for role_id in filtered_user_securty_dataframe['RoleID'].unique()]
\ No newline at end of file
@@ -0,0 +1,319 @@
+import os
+import json
+import argparse
+import pandas as pd
+from typing import Dict, List, Optional
+from src.utils.functions import chain_string_to_dict, filter_dataframe_by_a_value, read_csv_file
+from src.sync.kpi_store import KPIDataStore
+
+class SchemaMigration:
+    """
+    The SchemaMigration class rewrites the KPI_Values of a KPI when its Meta_Data in KPI_Info changes. 
+    It diffs the old and new metadata and applies the changes to the KPI rows in chunks: the values of a 
+    chunk are loaded into one DataFrame, so renames, drops, defaults and casts are vectorized column operations.
+
+    While a KPI is migrated, it is marked in the change log, so the app and the API refuse to edit its values 
+    against the old Meta_Data. The mark is removed by complete, once KPI_Info has the new Meta_Data.
+
+    Every operation is idempotent (renaming a missing key, dropping a missing key or casting an already cast 
+    value does nothing), so an interrupted migration can be resumed from its checkpoint or simply run again.
+
+    Every added field needs a default value. A value that cannot be cast (including a non-integral number 
+    cast to 'int' and a boolean cast to a number) is a cast failure: it would be saved as null, so execute 
+    refuses to run when there is any unless cast failures are explicitly allowed.
+
+    Attributes:
+        kpi (str): The name of the KPI to migrate.
+        old_metadata (dict): The metadata the current KPI values follow.
+        new_metadata (dict): The metadata the KPI values must follow after the migration.
+        renames (Dict[str, str]): A mapping from old field names to new field names.
+        defaults (dict): The default values of the added fields.
+
+    Methods:
+        __init__(kpi: str, old_metadata: dict, new_metadata: dict, renames: Optional[Dict[str, str]], defaults: Optional[dict]) -> None:
+            Initializes the SchemaMigration and validates the renames.
+
+        diff() -> Dict[str, list]:
+            Compares the old and new metadata.
+
+        migrate_values(kpi_values: pd.Series) -> pd.DataFrame:
+            Migrates a batch of KPI_Values strings and reports the rows that changed and the values that could not be cast.
+
+        dry_run(kpi_data_dataframe: pd.DataFrame, chunk_size: int) -> pd.DataFrame:
+            Reports what the migration would change without modifying the KPI data.
+
+        execute(kpi_data_store: KPIDataStore, path: str, chunk_size: int, checkpoint_path: Optional[str], allow_cast_failures: bool) -> pd.DataFrame:
+            Migrates the KPI data in chunks, saving it and a checkpoint after each chunk.
+
+        complete(kpi_data_store: KPIDataStore, kpi_info_dataframe: pd.DataFrame, kpi_info_path: str) -> None:
+            Saves the new Meta_Data in KPI_Info and allows the KPI to be edited again.
+    """
+
+    def __init__(self, kpi:str, old_metadata:dict, new_metadata:dict, renames:Optional[Dict[str, str]]=None, defaults:Optional[dict]=None)->None:
+        self.kpi = kpi
+        self.old_metadata = old_metadata
+        self.new_metadata = new_metadata
+        self.renames = renames or {}
+        self.defaults = defaults or {}
+
+        for old_name, new_name in self.renames.items():
+            if old_name not in old_metadata or new_name not in new_metadata:
+                raise ValueError(f"The rename '{old_name}' -> '{new_name}' does not match the old and new metadata.")
+
+        missing_defaults = [field for field in self.diff()['added'] if self.defaults.get(field) is None]
+        if missing_defaults:
+            raise ValueError(f"The added fields {missing_defaults} need a default value.")
+
+    def diff(self)->Dict[str, list]:
+        """
+        Compares the old and new metadata.
+
+        Returns:
+            Dict[str, list]: The 'added', 'removed', 'renamed' and 'retyped' fields. Renamed fields are 
+            (old name, new name) tuples and retyped fields are (name, old type, new type) tuples.
+        """
+        renamed_targets = set(self.renames.values())
+        # Compare the type of each field with the type it had before, following the renames.
+        previous_names = {new_name: old_name for old_name, new_name in self.renames.items()}
+
+        return {
+            'added': [field for field in self.new_metadata if field not in self.old_metadata and field not in renamed_targets],
+            'removed': [field for field in self.old_metadata if field not in self.new_metadata and field not in self.renames],
+            'renamed': list(self.renames.items()),
+            'retyped': [(field, self.old_metadata[previous_names.get(field, field)], data_type)
+                        for field, data_type in self.new_metadata.items()
+                        if previous_names.get(field, field) in self.old_metadata
+                        and self.old_metadata[previous_names.get(field, field)] != data_type],
+        }
+
+    @staticmethod
+    def _cast(column:pd.Series, data_type:str)->pd.Series:
+        # The column holds the parsed Python values (object dtype), so ints are not widened to floats before the cast.
+        match data_type:
+            case 'int':
+                numbers = pd.to_numeric(column.mask(column.map(type) == bool), errors='coerce')
+                # A non-integral number or a boolean becomes null, so it is reported as a cast failure instead of being converted.
+                return numbers.where(numbers % 1 == 0).astype('Int64')
+            case 'decimal' | 'float':
+                return pd.to_numeric(column.mask(column.map(type) == bool), errors='coerce').astype('Float64')
+            case 'str':
+                return column.astype('string')
+            case _:
+                raise ValueError(f"The data type '{data_type}' is not recognized. Please implement the cast for this input type.")
+
+    @staticmethod
+    def _is_same_record(record:dict, original_record:dict, retyped_fields:set)->bool:
+        # The types of the retyped fields are compared too, e.g. 2.0 cast from 'decimal' to 'int' is saved as 2.
+        return record.keys() == original_record.keys() and all(value == original_record[field]
+                                                               and (field not in retyped_fields or type(value) is type(original_record[field]))
+                                                               for field, value in record.items())
+
+    def migrate_values(self, kpi_values:pd.Series)->pd.DataFrame:
+        """
+        Migrates a batch of KPI_Values strings and reports the rows that changed and the values that could not be cast.
+
+        Args:
+            kpi_values (pd.Series): The KPI_Values strings to migrate.
+
+        Returns:
+            pd.DataFrame: A DataFrame with the same index as kpi_values and the columns 'KPI_Values' 
+            (the migrated JSON strings), 'changed' (whether the migrated values differ from the parsed 
+            original values) and 'cast_failures' (the fields whose value became null when cast).
+        """
+        original_records = [chain_string_to_dict(chain = value) for value in kpi_values]
+        # An object DataFrame keeps each value as parsed, e.g. an int in a column that also has nulls.
+        values_dataframe = pd.DataFrame(original_records, index = kpi_values.index, dtype = object)
+
+        # Renames go first, so the renamed fields are not dropped or defaulted.
+        values_dataframe = values_dataframe.rename(columns = self.renames)
+        values_dataframe = values_dataframe.drop(columns = [column for column in values_dataframe.columns if column not in self.new_metadata])
+
+        cast_failures = pd.Series([[] for _ in range(len(values_dataframe))], index = values_dataframe.index)
+        for field, data_type in self.new_metadata.items():
+            if field not in values_dataframe.columns:
+                values_dataframe[field] = self.defaults.get(field)
+            cast_column = self._cast(column = values_dataframe[field], data_type = data_type)
+            failed = values_dataframe[field].notna() & cast_column.isna()
+            for index in failed[failed].index:
+                cast_failures[index].append(field)
+            values_dataframe[field] = cast_column
+
+        # Convert the nullable dtypes back to plain Python values before serializing.
+        values_dataframe = values_dataframe[list(self.new_metadata)].astype(object)
+        records = values_dataframe.where(values_dataframe.notna(), None).to_dict(orient = 'records')
+
+        retyped_fields = {field for field, _, _ in self.diff()['retyped']}
+        # Compare the parsed values, so formatting differences (e.g. 2.50 and 2.5) do not count as changes. 
+        # Non-ASCII characters are written as is, like the rest of the KPI data file.
+        return pd.DataFrame({'KPI_Values': [json.dumps(record, ensure_ascii = False, default = lambda value: value.item()) for record in records],
+                             'changed': [not self._is_same_record(record = record, original_record = original_record, retyped_fields = retyped_fields)
+                                         for record, original_record in zip(records, original_records)],
+                             'cast_failures': cast_failures},
+                            index = values_dataframe.index)
+
+    def _chunks(self, kpi_data_dataframe:pd.DataFrame, chunk_size:int)->List[pd.Index]:
+        kpi_index = filter_dataframe_by_a_value(dataframe = kpi_data_dataframe, column_name = 'KPI', value = self.kpi).index
+        return [kpi_index[start:start + chunk_size] for start in range(0, len(kpi_index), chunk_size)]
+
+    def dry_run(self, kpi_data_dataframe:pd.DataFrame, chunk_size:int=100_000)->pd.DataFrame:
+        """
+        Reports what the migration would change without modifying the KPI data.
+
+        Args:
+            kpi_data_dataframe (pd.DataFrame): DataFrame containing KPI data.
+            chunk_size (int): The number of rows migrated at once (default is 100000).
+
+        Returns:
+            pd.DataFrame: A report with one row per KPI row that would change, with the columns 'KPI_Value_Date', 
+            'old_KPI_Values', 'new_KPI_Values' and 'cast_failures'.
+        """
+        reports = []
+        for chunk_index in self._chunks(kpi_data_dataframe = kpi_data_dataframe, chunk_size = chunk_size):
+            chunk = kpi_data_dataframe.loc[chunk_index]
+            migrated = self.migrate_values(kpi_values = chunk['KPI_Values'])
+            changed = migrated['changed']
+            reports.append(pd.DataFrame({'KPI_Value_Date': chunk['KPI_Value_Date'][changed],
+                                         'old_KPI_Values': chunk['KPI_Values'][changed],
+                                         'new_KPI_Values': migrated['KPI_Values'][changed],
+                                         'cast_failures': migrated['cast_failures'][changed]}))
+
+        if not reports:
+            return pd.DataFrame(columns = ['KPI_Value_Date', 'old_KPI_Values', 'new_KPI_Values', 'cast_failures'])
+        return pd.concat(reports)
+
+    def _migrate_chunk(self, kpi_data_dataframe:pd.DataFrame, chunk_index:pd.Index, allow_cast_failures:bool)->List[dict]:
+        # Migrate the up to date values of a chunk and return only the rows that changed.
+        chunk = kpi_data_dataframe.loc[chunk_index]
+        migrated = self.migrate_values(kpi_values = chunk['KPI_Values'])
+
+        if not allow_cast_failures and (migrated['cast_failures'].str.len() > 0).any():
+            raise ValueError("Some values changed since the check and cannot be cast anymore. Run the migration again.")
+
+        changed = migrated['changed']
+        return chunk.loc[changed, ['KPI', 'KPI_Value_Date']].assign(KPI_Values = migrated.loc[changed, 'KPI_Values']).to_dict(orient = 'records')
+
+    def execute(self, kpi_data_store:KPIDataStore, path:str, chunk_size:int=100_000, checkpoint_path:Optional[str]=None, allow_cast_failures:bool=False)->pd.DataFrame:
+        """
+        Migrates the KPI data in chunks, saving it and a checkpoint after each chunk.
+
+        The KPI is marked as being migrated before the first chunk, so the app and the API cannot edit it 
+        until complete is called. Each chunk is migrated and saved under the KPI data store write lock, from 
+        the values as they are at that moment, so the edits saved before the migration started are not lost.
+
+        Args:
+            kpi_data_store (KPIDataStore): The KPI data store, whose change log notifies the running app processes.
+            path (str): The file path of the KPI data CSV file.
+            chunk_size (int): The number of rows migrated at once (default is 100000).
+            checkpoint_path (Optional[str]): The file path of the checkpoint used to resume an interrupted migration.
+            allow_cast_failures (bool): Whether to save the values that cannot be cast as null (default is False).
+
+        Returns:
+            pd.DataFrame: The migrated KPI data.
+
+        Raises:
+            ValueError: If any value cannot be cast and cast failures are not allowed. Nothing is saved in that case.
+        """
+        kpi_data_dataframe = kpi_data_store.refresh()
+
+        if not allow_cast_failures:
+            report = self.dry_run(kpi_data_dataframe = kpi_data_dataframe, chunk_size = chunk_size)
+            failed_rows = int((report['cast_failures'].str.len() > 0).sum())
+            if failed_rows:
+                raise ValueError(f"{failed_rows} rows have values that cannot be cast. Run a dry run to review them "
+                                 "or allow the cast failures to save them as null.")
+
+        kpi_data_store.change_log.start_migration(kpi = self.kpi)
+
+        checkpoint = {'kpi': self.kpi, 'new_metadata': self.new_metadata, 'next_chunk': 0}
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as checkpoint_file:
+                saved_checkpoint = json.load(checkpoint_file)
+            # Only resume a checkpoint written by this same migration.
+            if saved_checkpoint['kpi'] == self.kpi and saved_checkpoint['new_metadata'] == self.new_metadata:
+                checkpoint = saved_checkpoint
+
+        # The store only changes values, never rows, so the chunks stay valid for the whole migration.
+        chunks = self._chunks(kpi_data_dataframe = kpi_data_dataframe, chunk_size = chunk_size)
+        for chunk_number in range(checkpoint['next_chunk'], len(chunks)):
+            kpi_data_store.update_with(build_changed_keys = lambda current_dataframe: self._migrate_chunk(kpi_data_dataframe = current_dataframe,
+                                                                                                          chunk_index = chunks[chunk_number],
+                                                                                                          allow_cast_failures = allow_cast_failures),
+                                       path = path,
+                                       migrating_kpi = self.kpi)
+
+            if checkpoint_path:
+                checkpoint['next_chunk'] = chunk_number + 1
+                with open(checkpoint_path, 'w') as checkpoint_file:
+                    json.dump(checkpoint, checkpoint_file)
+
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        return kpi_data_store.kpi_data_dataframe
+
+    def complete(self, kpi_data_store:KPIDataStore, kpi_info_dataframe:pd.DataFrame, kpi_info_path:str)->None:
+        """
+        Saves the new Meta_Data in KPI_Info and allows the KPI to be edited again. It must be called after execute, 
+        so the form and the API only validate against the new Meta_Data once every KPI value follows it.
+
+        Args:
+            kpi_data_store (KPIDataStore): The KPI data store, whose change log records the KPIs being migrated.
+            kpi_info_dataframe (pd.DataFrame): DataFrame containing KPI information.
+            kpi_info_path (str): The file path of the KPI information CSV file.
+        """
+        kpi_info_dataframe.loc[kpi_info_dataframe['KPI_Name'] == self.kpi, 'Meta_Data'] = json.dumps(self.new_metadata, ensure_ascii = False)
+        # Replace the file at once, since the app and the API reload KPI_Info as soon as it changes.
+        kpi_info_dataframe.to_csv(f'{kpi_info_path}.tmp', sep='|', index=False)
+        os.replace(f'{kpi_info_path}.tmp', kpi_info_path)
+        kpi_data_store.change_log.finish_migration(kpi = self.kpi)
+
+
+def main()->None:
+    """
+    Migrates the KPI_Values of a KPI to a new Meta_Data from the command line, e.g.:
+
+        python -m src.migration.schema_migration --kpi KPI1 --new-metadata '{"id": "int", "full_name": "str"}' --rename nombre=full_name --dry-run
+    """
+    parser = argparse.ArgumentParser(description = 'Migrate the KPI_Values of a KPI to a new Meta_Data.')
+    parser.add_argument('--kpi', required = True, help = 'The name of the KPI to migrate.')
+    parser.add_argument('--new-metadata', required = True, help = 'The new Meta_Data as a JSON object.')
+    parser.add_argument('--rename', action = 'append', default = [], help = 'A renamed field as old=new, can be repeated.')
+    parser.add_argument('--defaults', default = '{}', help = 'The default values of the added fields as a JSON object.')
+    parser.add_argument('--chunk-size', type = int, default = 100_000, help = 'The number of rows migrated at once.')
+    parser.add_argument('--dry-run', action = 'store_true', help = 'Only report what would change.')
+    parser.add_argument('--allow-cast-failures', action = 'store_true', help = 'Save the values that cannot be cast as null.')
+    parser.add_argument('--kpi-data', default = 'data/KPI_Data.csv')
+    parser.add_argument('--kpi-info', default = 'data/KPI_Info.csv')
+    parser.add_argument('--change-log', default = 'data/kpi_changes.db')
+    arguments = parser.parse_args()
+
+    kpi_data_store = KPIDataStore.from_files(kpi_data_path = arguments.kpi_data, change_log_path = arguments.change_log, watch = False)
+    kpi_info = read_csv_file(arguments.kpi_info, delimiter='|')
+    kpi_info_mask = kpi_info['KPI_Name'] == arguments.kpi
+
+    schema_migration = SchemaMigration(kpi = arguments.kpi,
+                                       old_metadata = chain_string_to_dict(kpi_info.loc[kpi_info_mask, 'Meta_Data'].values[0]),
+                                       new_metadata = json.loads(arguments.new_metadata),
+                                       renames = dict(rename.split('=', 1) for rename in arguments.rename),
+                                       defaults = json.loads(arguments.defaults))
+    print(f'Schema changes: {schema_migration.diff()}')
+
+    if arguments.dry_run:
+        report = schema_migration.dry_run(kpi_data_dataframe = kpi_data_store.refresh(), chunk_size = arguments.chunk_size)
+        print(f'{len(report)} rows would change, {int((report["cast_failures"].str.len() > 0).sum())} with cast failures.')
+        print(report.to_string())
+        kpi_data_store.close()
+        return
+
+    schema_migration.execute(kpi_data_store = kpi_data_store,
+                             path = arguments.kpi_data,
+                             chunk_size = arguments.chunk_size,
+                             checkpoint_path = f'{arguments.kpi_data}.{arguments.kpi}.migration.json',
+                             allow_cast_failures = arguments.allow_cast_failures)
+    schema_migration.complete(kpi_data_store = kpi_data_store, kpi_info_dataframe = kpi_info, kpi_info_path = arguments.kpi_info)
+    kpi_data_store.close()
+    print('Migration completed.')
+
+
+if __name__ == '__main__':
+    main()
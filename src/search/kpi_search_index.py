@@ -0,0 +1,119 @@
+import re
+import bisect
+import pandas as pd
+from typing import Dict, List, Optional, Set
+from src.utils.functions import chain_string_to_dict
+
+class KPISearchIndex:
+    """
+    The KPISearchIndex class builds an in-memory prefix/token index over the KPI names, the KPI IDs 
+    and the field names of the KPI_Info metadata. It returns the best ranked KPI names for a typed query, 
+    so only a small page of options has to be sent to the select box.
+
+    Attributes:
+        kpi_data_dataframe (pd.DataFrame): DataFrame containing KPI data.
+        kpi_info_dataframe (pd.DataFrame): DataFrame containing KPI information.
+        token_to_kpis (Dict[str, Set[str]]): A mapping from each token to the KPI names it appears in.
+        sorted_tokens (List[str]): The tokens sorted alphabetically, used for the prefix lookups.
+        kpi_names (List[str]): Every KPI name in the index, sorted alphabetically.
+
+    Methods:
+        __init__(kpi_data_dataframe: pd.DataFrame, kpi_info_dataframe: pd.DataFrame) -> None:
+            Initializes the KPISearchIndex and builds the index.
+
+        tokenize(text: str) -> List[str]:
+            Splits a text into lowercase alphanumeric tokens.
+
+        search(query: str, allowed_kpis: Optional[Set[str]], limit: int) -> List[str]:
+            Retrieves the best ranked KPI names for a query.
+    """
+
+    def __init__(self, kpi_data_dataframe:pd.DataFrame, kpi_info_dataframe:pd.DataFrame)->None:
+        self.kpi_data_dataframe = kpi_data_dataframe
+        self.kpi_info_dataframe = kpi_info_dataframe
+        self.token_to_kpis = {}
+        self._build()
+        self.sorted_tokens = sorted(self.token_to_kpis)
+        self.kpi_names = sorted({kpi for kpis in self.token_to_kpis.values() for kpi in kpis})
+
+    @staticmethod
+    def tokenize(text:str)->List[str]:
+        """
+        Splits a text into lowercase alphanumeric tokens.
+
+        Args:
+            text (str): The text to split.
+
+        Returns:
+            List[str]: The tokens found in the text.
+        """
+        return re.findall(r'[a-z0-9]+', str(text).lower())
+
+    def _add(self, kpi:str, text:str)->None:
+        # Index the whole text and each of its tokens for the KPI.
+        for token in {str(text).lower(), *self.tokenize(text = text)}:
+            self.token_to_kpis.setdefault(token, set()).add(kpi)
+
+    def _build(self)->None:
+        for kpi, kpi_id in self.kpi_data_dataframe[['KPI', 'KPI_Id']].drop_duplicates().itertuples(index=False):
+            self._add(kpi = kpi, text = kpi)
+            self._add(kpi = kpi, text = kpi_id)
+
+        for kpi, meta_data in self.kpi_info_dataframe[['KPI_Name', 'Meta_Data']].itertuples(index=False):
+            self._add(kpi = kpi, text = kpi)
+            try:
+                metadata_dict = chain_string_to_dict(chain = meta_data)
+            except Exception:
+                continue # Skip the field names of a malformed metadata, the KPI name is still indexed.
+            if isinstance(metadata_dict, dict):
+                for field_name in metadata_dict:
+                    self._add(kpi = kpi, text = field_name)
+
+    def _match_prefix(self, prefix:str)->Dict[str, int]:
+        # Score 2 for an exact token match and 1 for a prefix match, keeping the best one per KPI.
+        scores = {}
+        position = bisect.bisect_left(self.sorted_tokens, prefix)
+        while position < len(self.sorted_tokens) and self.sorted_tokens[position].startswith(prefix):
+            token = self.sorted_tokens[position]
+            score = 2 if token == prefix else 1
+            for kpi in self.token_to_kpis[token]:
+                scores[kpi] = max(scores.get(kpi, 0), score)
+            position += 1
+        return scores
+
+    def search(self, query:str, allowed_kpis:Optional[Set[str]]=None, limit:int=20)->List[str]:
+        """
+        Retrieves the best ranked KPI names for a query.
+
+        Every token of the query must match the start of an indexed token. KPIs with exact token matches 
+        and KPIs whose name starts with the query are ranked first.
+
+        Args:
+            query (str): The text typed by the user.
+            allowed_kpis (Optional[Set[str]]): The KPI names the user can access, or None to allow every KPI.
+            limit (int): The maximum number of KPI names to return (default is 20).
+
+        Returns:
+            List[str]: The best ranked KPI names, at most limit of them.
+        """
+        query_tokens = self.tokenize(text = query)
+
+        if not query_tokens:
+            kpi_names = [kpi for kpi in self.kpi_names if allowed_kpis is None or kpi in allowed_kpis]
+            return kpi_names[:limit]
+
+        scores = None
+        for query_token in query_tokens:
+            token_scores = self._match_prefix(prefix = query_token)
+            if scores is None:
+                scores = token_scores
+            else:
+                # Keep only the KPIs matching every token of the query.
+                scores = {kpi: score + token_scores[kpi] for kpi, score in scores.items() if kpi in token_scores}
+
+        query_lower = query.strip().lower()
+        ranked_kpis = sorted(
+            (kpi for kpi in scores if allowed_kpis is None or kpi in allowed_kpis),
+            key = lambda kpi: (-(scores[kpi] + (3 if kpi.lower().startswith(query_lower) else 0)), len(kpi), kpi)
+        )
+        return ranked_kpis[:limit]
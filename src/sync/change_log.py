@@ -0,0 +1,267 @@
+import json
+import time
+import sqlite3
+from contextlib import closing, contextmanager
+from typing import Iterator, List, Optional, Set, Tuple
+
+class ChangeLog:
+    """
+    The ChangeLog class stores change events in a SQLite table shared by every app process. 
+    Each event records the table that changed, a monotonically increasing version and the changed keys. 
+    The database write lock is also the lock every process holds while it writes the KPI data file. 
+    The KPIs being migrated are also recorded, so the other writers can refuse to edit them.
+
+    Each KPI data store reports the version it has applied, so the events every live store has already 
+    applied can be pruned. A store that has not reported for a while is no longer considered live; if it 
+    comes back after its events were pruned, it reloads the KPI data file instead.
+
+    Attributes:
+        path (str): The file path of the SQLite database.
+
+    Methods:
+        __init__(path: str) -> None:
+            Initializes the ChangeLog and creates the changes table if it does not exist.
+
+        transaction() -> Iterator[sqlite3.Connection]:
+            Opens a write transaction that holds the cross-process write lock until it ends.
+
+        publish(table_name: str, changed_keys: List[dict], connection: Optional[sqlite3.Connection]) -> int:
+            Appends a change event and returns its version.
+
+        get_changes_since(version: int, table_name: str, connection: Optional[sqlite3.Connection]) -> List[Tuple[int, List[dict]]]:
+            Retrieves the change events of a table newer than the given version.
+
+        get_last_version(connection: Optional[sqlite3.Connection]) -> int:
+            Retrieves the version of the latest change event.
+
+        get_oldest_version(connection: Optional[sqlite3.Connection]) -> int:
+            Retrieves the version of the oldest change event that was not pruned.
+
+        report_version(replica_id: str, version: int, connection: Optional[sqlite3.Connection], timeout: float) -> None:
+            Records the version a KPI data store has applied.
+
+        remove_replica(replica_id: str) -> None:
+            Stops considering a KPI data store as live.
+
+        prune(connection: Optional[sqlite3.Connection], max_age: float) -> int:
+            Deletes the change events every live KPI data store has applied.
+
+        start_migration(kpi: str) -> None:
+            Marks a KPI as being migrated.
+
+        finish_migration(kpi: str) -> None:
+            Marks a KPI as no longer being migrated.
+
+        get_migrating_kpis(connection: Optional[sqlite3.Connection]) -> Set[str]:
+            Retrieves the KPIs being migrated.
+    """
+
+    def __init__(self, path:str)->None:
+        self.path = path
+
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS changes ('
+                'version INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'table_name TEXT NOT NULL, '
+                'changed_keys TEXT NOT NULL)'
+            )
+            connection.execute('CREATE TABLE IF NOT EXISTS migrations (kpi TEXT PRIMARY KEY)')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS replicas ('
+                'replica_id TEXT PRIMARY KEY, '
+                'version INTEGER NOT NULL, '
+                'reported_at REAL NOT NULL)'
+            )
+
+    def _connect(self, timeout:float=30)->sqlite3.Connection:
+        # A generous timeout lets several processes write without raising 'database is locked'.
+        return sqlite3.connect(self.path, timeout=timeout)
+
+    @contextmanager
+    def transaction(self)->Iterator[sqlite3.Connection]:
+        """
+        Opens a write transaction that holds the cross-process write lock until it ends. 
+        The events published with the yielded connection are committed when the block exits 
+        and discarded if it raises.
+
+        Yields:
+            sqlite3.Connection: The connection holding the write lock.
+        """
+        # Writing the whole KPI data file can take a while, so the other writers wait longer for the lock.
+        with closing(self._connect(timeout=600)) as connection:
+            connection.isolation_level = None
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield connection
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+
+    def publish(self, table_name:str, changed_keys:List[dict], connection:Optional[sqlite3.Connection]=None)->int:
+        """
+        Appends a change event and returns its version.
+
+        Args:
+            table_name (str): The name of the table that changed.
+            changed_keys (List[dict]): The changed rows, each one with its key columns and new values.
+            connection (Optional[sqlite3.Connection]): The connection of an open transaction, or None to commit immediately.
+
+        Returns:
+            int: The version assigned to the change event.
+        """
+        if connection is not None:
+            return connection.execute('INSERT INTO changes (table_name, changed_keys) VALUES (?, ?)',
+                                      (table_name, json.dumps(changed_keys))).lastrowid
+
+        with closing(self._connect()) as own_connection, own_connection:
+            return self.publish(table_name = table_name, changed_keys = changed_keys, connection = own_connection)
+
+    def get_changes_since(self, version:int, table_name:str, connection:Optional[sqlite3.Connection]=None)->List[Tuple[int, List[dict]]]:
+        """
+        Retrieves the change events of a table newer than the given version.
+
+        Args:
+            version (int): The last version already applied by the caller.
+            table_name (str): The name of the table to retrieve the changes for.
+            connection (Optional[sqlite3.Connection]): The connection of an open transaction, or None to open one.
+
+        Returns:
+            List[Tuple[int, List[dict]]]: A list of (version, changed keys) tuples ordered by version.
+        """
+        if connection is None:
+            with closing(self._connect()) as own_connection:
+                return self.get_changes_since(version = version, table_name = table_name, connection = own_connection)
+
+        rows = connection.execute('SELECT version, changed_keys FROM changes '
+                                  'WHERE version > ? AND table_name = ? ORDER BY version',
+                                  (version, table_name)).fetchall()
+        return [(row_version, json.loads(changed_keys)) for row_version, changed_keys in rows]
+
+    def get_last_version(self, connection:Optional[sqlite3.Connection]=None)->int:
+        """
+        Retrieves the version of the latest change event, even if it was pruned.
+
+        Args:
+            connection (Optional[sqlite3.Connection]): The connection of an open transaction, or None to open one.
+
+        Returns:
+            int: The latest version, or 0 if no change has been published.
+        """
+        if connection is None:
+            with closing(self._connect()) as own_connection:
+                return self.get_last_version(connection = own_connection)
+
+        # AUTOINCREMENT keeps the last version in sqlite_sequence after the events are deleted.
+        last_version = connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        return last_version[0] if last_version else 0
+
+    def get_oldest_version(self, connection:Optional[sqlite3.Connection]=None)->int:
+        """
+        Retrieves the version of the oldest change event that was not pruned. A store whose version is 
+        lower than this one minus one has missed pruned events.
+
+        Args:
+            connection (Optional[sqlite3.Connection]): The connection of an open transaction, or None to open one.
+
+        Returns:
+            int: The oldest version kept, or the next version if every event was pruned.
+        """
+        if connection is None:
+            with closing(self._connect()) as own_connection:
+                return self.get_oldest_version(connection = own_connection)
+
+        oldest_version = connection.execute('SELECT MIN(version) FROM changes').fetchone()[0]
+        return oldest_version if oldest_version is not None else self.get_last_version(connection = connection) + 1
+
+    def report_version(self, replica_id:str, version:int, connection:Optional[sqlite3.Connection]=None, timeout:float=30)->None:
+        """
+        Records the version a KPI data store has applied.
+
+        Args:
+            replica_id (str): The unique ID of the KPI data store.
+            version (int): The version of the last change event it applied.
+            connection (Optional[sqlite3.Connection]): The connection of an open transaction, or None to commit immediately.
+            timeout (float): The seconds to wait for the write lock when no connection is given (default is 30).
+
+        Raises:
+            sqlite3.OperationalError: If the write lock is not obtained within the timeout.
+        """
+        if connection is not None:
+            connection.execute('INSERT OR REPLACE INTO replicas (replica_id, version, reported_at) VALUES (?, ?, ?)',
+                               (replica_id, version, time.time()))
+            return
+
+        with closing(self._connect(timeout = timeout)) as own_connection, own_connection:
+            self.report_version(replica_id = replica_id, version = version, connection = own_connection)
+
+    def remove_replica(self, replica_id:str)->None:
+        """
+        Stops considering a KPI data store as live, so it no longer holds back the pruning.
+
+        Args:
+            replica_id (str): The unique ID of the KPI data store.
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.execute('DELETE FROM replicas WHERE replica_id = ?', (replica_id,))
+
+    def prune(self, connection:Optional[sqlite3.Connection]=None, max_age:float=86_400)->int:
+        """
+        Deletes the change events every live KPI data store has applied. The stores that have not reported 
+        their version within max_age seconds are no longer considered live.
+
+        Args:
+            connection (Optional[sqlite3.Connection]): The connection of an open transaction, or None to commit immediately.
+            max_age (float): The seconds after which a silent store is no longer considered live (default is one day).
+
+        Returns:
+            int: The number of change events deleted.
+        """
+        if connection is None:
+            with closing(self._connect()) as own_connection, own_connection:
+                return self.prune(connection = own_connection, max_age = max_age)
+
+        connection.execute('DELETE FROM replicas WHERE reported_at < ?', (time.time() - max_age,))
+        oldest_live_version = connection.execute('SELECT MIN(version) FROM replicas').fetchone()[0]
+        if oldest_live_version is None:
+            # Without live stores, every new store starts from the KPI data file.
+            oldest_live_version = self.get_last_version(connection = connection)
+        return connection.execute('DELETE FROM changes WHERE version <= ?', (oldest_live_version,)).rowcount
+
+    def start_migration(self, kpi:str)->None:
+        """
+        Marks a KPI as being migrated. It stays marked if the migration is interrupted, since its values 
+        may follow either metadata until the migration is resumed.
+
+        Args:
+            kpi (str): The name of the KPI being migrated.
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.execute('INSERT OR IGNORE INTO migrations (kpi) VALUES (?)', (kpi,))
+
+    def finish_migration(self, kpi:str)->None:
+        """
+        Marks a KPI as no longer being migrated.
+
+        Args:
+            kpi (str): The name of the migrated KPI.
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.execute('DELETE FROM migrations WHERE kpi = ?', (kpi,))
+
+    def get_migrating_kpis(self, connection:Optional[sqlite3.Connection]=None)->Set[str]:
+        """
+        Retrieves the KPIs being migrated.
+
+        Args:
+            connection (Optional[sqlite3.Connection]): The connection of an open transaction, or None to open one.
+
+        Returns:
+            Set[str]: The names of the KPIs being migrated.
+        """
+        if connection is None:
+            with closing(self._connect()) as own_connection:
+                return self.get_migrating_kpis(connection = own_connection)
+
+        return {kpi for kpi, in connection.execute('SELECT kpi FROM migrations').fetchall()}
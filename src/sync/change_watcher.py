@@ -0,0 +1,76 @@
+import os
+import threading
+from watchdog.events import FileSystemEventHandler, FileSystemEvent
+from watchdog.observers import Observer
+
+class ChangeWatcher(FileSystemEventHandler):
+    """
+    The ChangeWatcher class uses watchdog to detect when another process writes to the change log. 
+    It only raises a flag, so checking for changes costs nothing until the file is modified.
+
+    Attributes:
+        path (str): The absolute file path of the change log database.
+        pending (threading.Event): Set when the change log has been modified since the last check.
+        observer (Observer): The watchdog observer that monitors the change log directory.
+
+    Methods:
+        __init__(path: str) -> None:
+            Initializes the ChangeWatcher for the given change log path.
+
+        start() -> None:
+            Starts watching the change log directory in a background thread.
+
+        stop() -> None:
+            Stops the background observer.
+
+        on_any_event(event: FileSystemEvent) -> None:
+            Marks the change log as modified when one of its files changes.
+
+        consume() -> bool:
+            Returns whether the change log was modified and clears the flag.
+    """
+
+    def __init__(self, path:str)->None:
+        super().__init__()
+        self.path = os.path.abspath(path)
+        self.pending = threading.Event()
+        self.pending.set() # Force a first check for changes published before the watcher started.
+        self.observer = Observer()
+
+    def start(self)->None:
+        """
+        Starts watching the change log directory in a background thread.
+        """
+        self.observer.schedule(self, path = os.path.dirname(self.path), recursive = False)
+        self.observer.daemon = True
+        self.observer.start()
+
+    def stop(self)->None:
+        """
+        Stops the background observer.
+        """
+        self.observer.stop()
+        self.observer.join()
+
+    def on_any_event(self, event:FileSystemEvent)->None:
+        """
+        Marks the change log as modified when one of its files changes.
+
+        Args:
+            event (FileSystemEvent): The event emitted by watchdog.
+        """
+        # SQLite also writes journal files next to the database (e.g. '<name>-journal').
+        if os.path.basename(event.src_path).startswith(os.path.basename(self.path)):
+            self.pending.set()
+
+    def consume(self)->bool:
+        """
+        Returns whether the change log was modified and clears the flag.
+
+        Returns:
+            bool: True if the change log was modified since the last call, False otherwise.
+        """
+        if self.pending.is_set():
+            self.pending.clear()
+            return True
+        return False
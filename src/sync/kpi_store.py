@@ -0,0 +1,267 @@
+import os
+import json
+import uuid
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+from typing import Callable, List, Optional, Tuple
+from src.utils.loading import TABLE_DTYPES, read_csv_files_in_parallel
+from .change_log import ChangeLog
+from .change_watcher import ChangeWatcher
+
+class KPIDataStore:
+    """
+    The KPIDataStore class keeps the KPI data in memory for one app process and keeps it in sync 
+    with the other processes through the change log. Only the rows named in a change event are 
+    updated, so the KPI data file is never re-read after start-up. Edits only change KPI_Values and 
+    rows never move, so the row positions of each (KPI, KPI_Value_Date) key are indexed once.
+
+    Every write holds the change log write lock, applies the events other processes published, 
+    then saves the KPI data file and publishes its own event, so no process overwrites another 
+    process' changes. Writes to a KPI being migrated are refused, except the migration's own.
+
+    Each store reports the version it has applied to the change log, and every write prunes the events 
+    all live stores have applied. A store that missed pruned events reloads the KPI values from the file.
+
+    Attributes:
+        kpi_data_dataframe (pd.DataFrame): DataFrame containing KPI data.
+        change_log (ChangeLog): The change log shared by every app process.
+        watcher (Optional[ChangeWatcher]): The watcher that signals new change events, if any.
+        table_name (str): The name of the table in the change log.
+        version (int): The version of the last change event applied. It must be read from the change log 
+            before the KPI data file (default is 0): the events after it are replayed on the next refresh, 
+            which is harmless for the ones the file already contains.
+        path (Optional[str]): The file path of the KPI data CSV file, reloaded when the store missed pruned events.
+        replica_id (str): The unique ID of this store in the change log.
+        key_index (pd.MultiIndex): The unique (KPI, KPI_Value_Date) keys, in order of first appearance.
+        row_order (np.ndarray): The row positions grouped by key, in the order of key_index.
+        key_bounds (np.ndarray): The start of the rows of each key in row_order, followed by the number of rows.
+
+    Methods:
+        __init__(kpi_data_dataframe: pd.DataFrame, change_log: ChangeLog, watcher: Optional[ChangeWatcher], table_name: str, version: int, path: Optional[str]) -> None:
+            Initializes the KPIDataStore with the KPI data and the change log.
+
+        from_files(kpi_data_path: str, change_log_path: str, watch: bool) -> KPIDataStore:
+            Creates a KPI data store from the KPI data file and the change log, in the order that skips no event.
+
+        close() -> None:
+            Stops the watcher and no longer holds back the pruning of the change log.
+
+        get_row_positions(keys: pd.MultiIndex) -> np.ndarray:
+            Retrieves the position of the row of each (KPI, KPI_Value_Date) key.
+
+        refresh() -> pd.DataFrame:
+            Applies the change events published by other processes and returns the KPI data.
+
+        update_with(build_changed_keys: Callable[[pd.DataFrame], List[dict]], path: str, migrating_kpi: Optional[str]) -> List[dict]:
+            Computes changes from the up to date KPI data, saves them and publishes them under the write lock.
+
+        update_kpi_values(kpi: str, kpi_value_date: str, kpi_values: dict, path: str) -> None:
+            Updates the values of a KPI, saves the KPI data and publishes the change.
+
+        update_many_kpi_values(rows: List[Tuple[str, str, dict]], path: str) -> None:
+            Updates the values of several KPIs with a single save and a single change event.
+    """
+
+    def __init__(self, kpi_data_dataframe:pd.DataFrame, change_log:ChangeLog, watcher:Optional[ChangeWatcher]=None, table_name:str='KPI_Data', version:int=0, path:Optional[str]=None)->None:
+        self.kpi_data_dataframe = kpi_data_dataframe
+        self.change_log = change_log
+        self.watcher = watcher
+        self.table_name = table_name
+        self.version = version
+        self.path = path
+        self.replica_id = uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.change_log.report_version(replica_id = self.replica_id, version = version)
+
+        # Number each key by its first appearance; a key can name several rows in legacy files.
+        keys = kpi_data_dataframe[['KPI', 'KPI_Value_Date']]
+        key_numbers = keys.groupby(['KPI', 'KPI_Value_Date'], sort = False, dropna = False).ngroup().to_numpy()
+        self.row_order = np.argsort(key_numbers, kind = 'stable')
+        self.key_bounds = np.searchsorted(key_numbers[self.row_order], np.arange(key_numbers.max(initial = -1) + 2))
+        self.key_index = pd.MultiIndex.from_frame(keys.iloc[self.row_order[self.key_bounds[:-1]]])
+
+    @classmethod
+    def from_files(cls, kpi_data_path:str, change_log_path:str, watch:bool=True)->'KPIDataStore':
+        """
+        Creates a KPI data store from the KPI data file and the change log, in the order that skips no event.
+
+        Args:
+            kpi_data_path (str): The file path of the KPI data CSV file.
+            change_log_path (str): The file path of the change log database.
+            watch (bool): Whether to watch the change log for the events of other processes (default is True).
+
+        Returns:
+            KPIDataStore: The KPI data store.
+        """
+        change_log = ChangeLog(path = change_log_path)
+        # Read the version before the file, so no event published in between is skipped.
+        version = change_log.get_last_version()
+        dataframes, load_times = read_csv_files_in_parallel(tables = {'KPI_Data': {'path': kpi_data_path, 'dtype': TABLE_DTYPES['KPI_Data']}})
+        print(f"Loaded KPI_Data in {load_times['KPI_Data']:.3f} seconds")
+
+        watcher = ChangeWatcher(path = change_log_path) if watch else None
+        kpi_data_store = cls(kpi_data_dataframe = dataframes['KPI_Data'],
+                             change_log = change_log,
+                             watcher = watcher,
+                             version = version,
+                             path = kpi_data_path)
+        if watcher is not None:
+            watcher.start()
+        return kpi_data_store
+
+    def close(self)->None:
+        """
+        Stops the watcher and no longer holds back the pruning of the change log.
+        """
+        if self.watcher is not None:
+            self.watcher.stop()
+        self.change_log.remove_replica(replica_id = self.replica_id)
+
+    def _get_all_row_positions(self, keys:pd.MultiIndex)->Tuple[np.ndarray, np.ndarray]:
+        # Return every row of each key found, with the position of its key in keys.
+        key_numbers = self.key_index.get_indexer(keys)
+        found = np.flatnonzero(key_numbers >= 0)
+        starts = self.key_bounds[key_numbers[found]]
+        lengths = self.key_bounds[key_numbers[found] + 1] - starts
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return self.row_order[np.repeat(starts, lengths) + offsets], np.repeat(found, lengths)
+
+    def get_row_positions(self, keys:pd.MultiIndex)->np.ndarray:
+        """
+        Retrieves the position of the row of each (KPI, KPI_Value_Date) key. The last row is used when a key 
+        names several rows.
+
+        Args:
+            keys (pd.MultiIndex): The (KPI, KPI_Value_Date) keys to look up.
+
+        Returns:
+            np.ndarray: The row position of each key, or -1 if the key does not exist.
+        """
+        key_numbers = self.key_index.get_indexer(keys)
+        return np.where(key_numbers >= 0, self.row_order[self.key_bounds[key_numbers + 1] - 1], -1)
+
+    def _apply(self, changed_keys:List[dict])->None:
+        # Overwrite the values of the rows matching each (KPI, KPI_Value_Date) key, looking up only the changed keys.
+        changes = pd.DataFrame(changed_keys).drop_duplicates(subset = ['KPI', 'KPI_Value_Date'], keep = 'last')
+        rows, change_positions = self._get_all_row_positions(keys = pd.MultiIndex.from_frame(changes[['KPI', 'KPI_Value_Date']]))
+        self.kpi_data_dataframe.iloc[rows, self.kpi_data_dataframe.columns.get_loc('KPI_Values')] = changes['KPI_Values'].to_numpy()[change_positions]
+
+    def _reload(self, connection:Optional[sqlite3.Connection]=None)->None:
+        if self.path is None:
+            raise ValueError(f"The change events after version {self.version} were pruned and the store has no KPI data file to reload. "
+                             "Create it with KPIDataStore.from_files.")
+
+        # Read the version before the file, like at start-up; rows never move, so only the values are replaced.
+        version = self.change_log.get_last_version(connection = connection)
+        dataframes, _ = read_csv_files_in_parallel(tables = {'KPI_Data': {'path': self.path, 'dtype': TABLE_DTYPES['KPI_Data']}})
+        self.kpi_data_dataframe['KPI_Values'] = dataframes['KPI_Data']['KPI_Values'].to_numpy()
+        self.version = version
+
+    def _apply_changes_since_version(self, connection:Optional[sqlite3.Connection]=None)->None:
+        if self.version + 1 < self.change_log.get_oldest_version(connection = connection):
+            self._reload(connection = connection)
+
+        changes = self.change_log.get_changes_since(version = self.version, table_name = self.table_name, connection = connection)
+        if changes:
+            # Apply every pending event in one pass; the later events win for a key changed more than once.
+            self._apply(changed_keys = [changed_key for _, changed_keys in changes for changed_key in changed_keys])
+            self.version = changes[-1][0]
+
+    def _save(self, path:str)->None:
+        # Write to a temporary file first, so readers never see a half written file.
+        temporary_path = f'{path}.tmp'
+        self.kpi_data_dataframe.to_csv(temporary_path, sep='|')
+        os.replace(temporary_path, path)
+
+    def refresh(self)->pd.DataFrame:
+        """
+        Applies the change events published by other processes and returns the KPI data.
+
+        Returns:
+            pd.DataFrame: A DataFrame containing the up to date KPI data.
+        """
+        with self.lock:
+            # Without a watcher the change log is queried on every call.
+            if self.watcher is None or self.watcher.consume():
+                version = self.version
+                self._apply_changes_since_version()
+                if self.version != version:
+                    try:
+                        # Reporting is best effort: a write holding the lock should not block the readers.
+                        self.change_log.report_version(replica_id = self.replica_id, version = self.version, timeout = 0.1)
+                    except sqlite3.OperationalError:
+                        pass
+            return self.kpi_data_dataframe
+
+    def update_with(self, build_changed_keys:Callable[[pd.DataFrame], List[dict]], path:str, migrating_kpi:Optional[str]=None)->List[dict]:
+        """
+        Computes changes from the up to date KPI data, saves them and publishes them under the write lock.
+
+        Args:
+            build_changed_keys (Callable[[pd.DataFrame], List[dict]]): Receives the up to date KPI data and returns 
+                the changed rows, each one with the keys 'KPI', 'KPI_Value_Date' and 'KPI_Values' (a serialized string).
+            path (str): The file path of the KPI data CSV file.
+            migrating_kpi (Optional[str]): The KPI the caller is migrating, which it is allowed to write (default is None).
+
+        Returns:
+            List[dict]: The changed rows that were saved.
+
+        Raises:
+            ValueError: If a changed row belongs to another KPI being migrated. Nothing is saved in that case.
+        """
+        with self.change_log.transaction() as connection:
+            with self.lock:
+                # Catch up with the other processes first, so their changes are not overwritten by the save.
+                self._apply_changes_since_version(connection = connection)
+
+                changed_keys = build_changed_keys(self.kpi_data_dataframe)
+                # Checked under the write lock, so no edit is saved once a migration has started.
+                blocked_kpis = {changed_key['KPI'] for changed_key in changed_keys} & (self.change_log.get_migrating_kpis(connection = connection) - {migrating_kpi})
+                if blocked_kpis:
+                    raise ValueError(f"The KPIs {sorted(blocked_kpis)} are being migrated to a new Meta_Data and cannot be edited until the migration finishes.")
+                if not changed_keys:
+                    return changed_keys
+                self._apply(changed_keys = changed_keys)
+
+            # No other writer can publish while the write lock is held, so the readers of this process 
+            # only wait for the update in memory, not for the save of the whole file.
+            self._save(path = path)
+
+            with self.lock:
+                # The write lock is held since the catch up, so this event directly follows the ones already applied.
+                self.version = self.change_log.publish(table_name = self.table_name, changed_keys = changed_keys, connection = connection)
+                self.change_log.report_version(replica_id = self.replica_id, version = self.version, connection = connection)
+                self.change_log.prune(connection = connection)
+            return changed_keys
+
+    def update_kpi_values(self, kpi:str, kpi_value_date:str, kpi_values:dict, path:str)->None:
+        """
+        Updates the values of a KPI, saves the KPI data and publishes the change.
+
+        Args:
+            kpi (str): The name of the KPI to update.
+            kpi_value_date (str): The date of the KPI value to update.
+            kpi_values (dict): The new values of the KPI.
+            path (str): The file path of the KPI data CSV file.
+
+        Raises:
+            ValueError: If the KPI is being migrated.
+        """
+        self.update_many_kpi_values(rows = [(kpi, kpi_value_date, kpi_values)], path = path)
+
+    def update_many_kpi_values(self, rows:List[Tuple[str, str, dict]], path:str)->None:
+        """
+        Updates the values of several KPIs with a single save and a single change event.
+
+        Args:
+            rows (List[Tuple[str, str, dict]]): The (KPI name, KPI value date, new values) of each row to update.
+            path (str): The file path of the KPI data CSV file.
+
+        Raises:
+            ValueError: If any of the KPIs is being migrated. Nothing is saved in that case.
+        """
+        changed_keys = [{'KPI': kpi, 'KPI_Value_Date': kpi_value_date, 'KPI_Values': json.dumps(kpi_values)}
+                        for kpi, kpi_value_date, kpi_values in rows]
+        self.update_with(build_changed_keys = lambda kpi_data_dataframe: changed_keys, path = path)
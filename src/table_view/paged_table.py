@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from typing import Any, Hashable
+from src.utils.functions import chain_string_to_dict
+
+class PagedTable:
+    """
+    The PagedTable class displays a large DataFrame one fixed-size page at a time. The sort and filter 
+    order is computed once and cached in the session state, so changing page only slices that order and 
+    only the visible rows are serialized to the browser. The KPI_Values of the visible rows can be 
+    expanded into one column per field.
+
+    Attributes:
+        dataframe (pd.DataFrame): The DataFrame to display, e.g. the role-filtered KPI data.
+        data_version (Hashable): Identifies the content of the DataFrame, including which rows it has (e.g. the versions 
+            of the KPI data and of the role security data); the cached order is recomputed when it changes.
+        key (str): A unique key for the widgets and the cached order of this table.
+
+    Methods:
+        __init__(dataframe: pd.DataFrame, data_version: Hashable, key: str) -> None:
+            Initializes the PagedTable.
+
+        get_order(filter_text: str, sort_column: str, ascending: bool) -> np.ndarray:
+            Retrieves the positions of the filtered rows in sort order, cached in the session state.
+
+        get_page(order: np.ndarray, offset: int, limit: int, expand_values: bool) -> pd.DataFrame:
+            Retrieves the rows of a page, optionally expanding their KPI_Values.
+
+        show() -> None:
+            Displays the table controls and the current page inside a fragment.
+    """
+
+    def __init__(self, dataframe:pd.DataFrame, data_version:Hashable, key:str)->None:
+        self.dataframe = dataframe
+        self.data_version = data_version
+        self.key = key
+
+    def _get_sort_values(self, sort_column:str)->pd.Series:
+        # Dates are stored as dd/mm/yyyy strings, so they are parsed to sort them chronologically.
+        if sort_column == 'KPI_Value_Date':
+            return pd.to_datetime(self.dataframe[sort_column], format='%d/%m/%Y', errors='coerce')
+        return self.dataframe[sort_column]
+
+    def get_order(self, filter_text:str, sort_column:str, ascending:bool)->np.ndarray:
+        """
+        Retrieves the positions of the filtered rows in sort order, cached in the session state.
+
+        Args:
+            filter_text (str): The text the rows must contain in any column (case insensitive), or '' to keep every row.
+            sort_column (str): The column to sort by.
+            ascending (bool): Whether to sort in ascending order.
+
+        Returns:
+            np.ndarray: The positions of the rows to display, in display order.
+        """
+        # The number of rows guards against a stale order indexing past a smaller DataFrame.
+        signature = (self.data_version, len(self.dataframe), filter_text, sort_column, ascending)
+        cached_order = st.session_state.get(f'{self.key}_order')
+        if cached_order is not None and cached_order[0] == signature:
+            return cached_order[1]
+
+        positions = np.arange(len(self.dataframe))
+        if filter_text:
+            mask = np.zeros(len(self.dataframe), dtype=bool)
+            for column in self.dataframe.columns:
+                mask |= self.dataframe[column].astype(str).str.contains(filter_text, case=False, regex=False).to_numpy()
+            positions = positions[mask]
+
+        sort_values = self._get_sort_values(sort_column = sort_column).iloc[positions]
+        order = positions[np.argsort(sort_values.to_numpy(), kind='stable')]
+        if not ascending:
+            order = order[::-1]
+
+        st.session_state[f'{self.key}_order'] = (signature, order)
+        return order
+
+    def get_page(self, order:np.ndarray, offset:int, limit:int, expand_values:bool)->pd.DataFrame:
+        """
+        Retrieves the rows of a page, optionally expanding their KPI_Values.
+
+        Args:
+            order (np.ndarray): The positions of the rows to display, in display order.
+            offset (int): The number of rows before the page.
+            limit (int): The number of rows of the page.
+            expand_values (bool): Whether to replace KPI_Values by one column per field.
+
+        Returns:
+            pd.DataFrame: The rows of the page.
+        """
+        page = self.dataframe.iloc[order[offset:offset + limit]]
+        if not expand_values or 'KPI_Values' not in page.columns:
+            return page
+
+        # Only the visible rows are parsed, however many rows the table has.
+        values = pd.DataFrame.from_records([chain_string_to_dict(chain = kpi_values) for kpi_values in page['KPI_Values']],
+                                           index = page.index)
+        return pd.concat([page.drop(columns = 'KPI_Values'), values], axis = 1)
+
+    def _show_page(self)->None:
+        col1, col2, col3 = st.columns(spec = 3)
+        with col1:
+            filter_text = st.text_input(label = 'Filter', placeholder = 'Type a text to filter the rows ...', key = f'{self.key}_filter')
+        with col2:
+            sort_column = st.selectbox(label = 'Sort by', options = self.dataframe.columns.tolist(), key = f'{self.key}_sort')
+        with col3:
+            ascending = st.toggle(label = 'Ascending', value = True, key = f'{self.key}_ascending')
+
+        order = self.get_order(filter_text = filter_text, sort_column = sort_column, ascending = ascending)
+
+        col1, col2, col3 = st.columns(spec = 3)
+        with col1:
+            limit = st.selectbox(label = 'Rows per page', options = [25, 50, 100, 500], key = f'{self.key}_limit')
+        total_pages = max(1, -(-len(order) // limit))
+        with col2:
+            page_number = st.number_input(label = f'Page (of {total_pages})', min_value = 1, max_value = total_pages, value = 1, step = 1, key = f'{self.key}_page')
+        with col3:
+            expand_values = st.toggle(label = 'Expand KPI values', value = False, key = f'{self.key}_expand')
+
+        offset = (min(page_number, total_pages) - 1) * limit
+        page = self.get_page(order = order, offset = offset, limit = limit, expand_values = expand_values)
+
+        st.caption(f'Rows {offset + 1 if len(order) else 0} to {offset + len(page)} of {len(order)}')
+        st.dataframe(data = page, hide_index = True)
+
+    def show(self)->None:
+        """
+        Displays the table controls and the current page inside a fragment, so paging, sorting and 
+        filtering only rerun the table instead of the whole app.
+        """
+        with st.container(border=True):
+            st.fragment(self._show_page)()
@@ -1,25 +1,74 @@
+import numpy as np
 import pandas as pd
 import streamlit as st
 import ast
-from typing import List, Any
+import json
+from typing import List, Any, Optional
 
-def read_csv_file(path: str, delimiter: str = '|') -> pd.DataFrame:
+def read_csv_file(path: str, delimiter: str = '|', dtype: Optional[dict] = None, engine: Optional[str] = None) -> pd.DataFrame:
     """
     Reads a CSV file with a specified delimiter.
 
     Args:
         path (str): The file path of the CSV file to be read.
         delimiter (str): The delimiter used in the CSV file (default is '|').
+        dtype (Optional[dict]): The columns to read and their types, or None to read every column (default is None). 
+            The columns missing from the file are skipped, so optional columns can be listed.
+        engine (Optional[str]): The parser engine, e.g. 'pyarrow' for the multithreaded reader (default is the C parser).
 
     Returns:
         pd.DataFrame: A DataFrame containing the data from the CSV file.
     """
     try:
-        return pd.read_csv(filepath_or_buffer=path, delimiter=delimiter)
+        if dtype:
+            # Read the header first, since the pyarrow engine does not accept a callable usecols.
+            columns = pd.read_csv(filepath_or_buffer=path, delimiter=delimiter, nrows=0).columns
+            dtype = {column: column_type for column, column_type in dtype.items() if column in columns}
+            dataframe = pd.read_csv(filepath_or_buffer=path, delimiter=delimiter, usecols=list(dtype), dtype=to_reading_dtype(dtype), engine=engine)
+            return cast_columns(dataframe=dataframe, dtype=dtype)
+        return pd.read_csv(filepath_or_buffer=path, delimiter=delimiter, engine=engine)
     except Exception as e:
         raise Exception(f"An error occurred while reading the CSV file: {e}")
         
 
+def to_reading_dtype(dtype: dict) -> dict:
+    """
+    Converts column types to the ones used to read a CSV file: the str columns are read as 'string', 
+    since the pyarrow engine writes the missing values of a str column as the text 'None'.
+
+    Args:
+        dtype (dict): The columns and their types.
+
+    Returns:
+        dict: The columns and the types to read them with.
+    """
+    return {column: 'string' if column_type is str else column_type for column, column_type in dtype.items()}
+
+
+def cast_columns(dataframe: pd.DataFrame, dtype: dict) -> pd.DataFrame:
+    """
+    Casts the columns of a DataFrame to the given types. The str columns hold Python strings and keep 
+    their missing values as NaN, instead of the text 'None' or 'nan' that astype(str) writes.
+
+    Args:
+        dataframe (pd.DataFrame): The DataFrame to cast.
+        dtype (dict): The columns and their types; None keeps the column as it is.
+
+    Returns:
+        pd.DataFrame: The DataFrame with its columns cast.
+    """
+    try:
+        for column, column_type in dtype.items():
+            if column_type is str:
+                text = dataframe[column].astype('string')
+                dataframe[column] = text.astype(object).where(text.notna(), np.nan)
+            elif column_type is not None:
+                dataframe[column] = dataframe[column].astype(column_type)
+        return dataframe
+    except Exception as e:
+        raise Exception(f"An error occurred while casting the columns: {e}")
+
+
 def get_list_unique_values_from_dataframe(dataframe: pd.DataFrame, column_name: str) -> List[Any]:
     """
     Returns a list of unique values from a specified column in the DataFrame.
@@ -80,11 +129,16 @@ def chain_string_to_dict(chain: str) -> dict:
     Converts a string representation of a dictionary into an actual Python dictionary.
 
     Args:
-        chain (str): A string representation of a dictionary (e.g., "{'key': 'value'}").
+        chain (str): A JSON object (e.g., '{"key": null}') or a Python literal (e.g., "{'key': None}").
 
     Returns:
         dict: A Python dictionary converted from the string, or an empty dictionary if conversion fails.
     """
+    try:
+        # The app saves JSON, which can hold null, true and false that ast.literal_eval does not accept.
+        return json.loads(chain)
+    except (TypeError, ValueError):
+        pass
     try:
         # Use ast.literal_eval to safely evaluate the string as a Python literal
         dictionary = ast.literal_eval(chain)
@@ -114,6 +168,29 @@ def selectbox_with_a_placeholder(dataframe: pd.DataFrame, column_name: str, labe
         raise Exception(f"An error occurred while creating the select box: {e}")
         
 
+def search_selectbox_with_a_placeholder(search_index: Any, allowed_values: set, label: str, placeholder: str, limit: int = 20) -> Any:
+    """
+    Creates a text input to search values and a select box with a placeholder showing only the best ranked matches.
+
+    Args:
+        search_index (Any): The search index used to rank the values (e.g., a KPISearchIndex).
+        allowed_values (set): The values the user can select.
+        label (str): The label displayed for the select box.
+        placeholder (str): The placeholder text displayed in the select box.
+        limit (int): The maximum number of options sent to the select box (default is 20).
+
+    Returns:
+        Any: The selected option from the select box.
+    """
+    try:
+        query = st.text_input(label=f'Search: {label}', placeholder='Type a name, an ID or a field ...')
+        options_list = search_index.search(query=query, allowed_kpis=allowed_values, limit=limit)
+        option = st.selectbox(label=label, options=options_list, placeholder=placeholder, index=None)
+        return option
+    except Exception as e:
+        raise Exception(f"An error occurred while creating the search select box: {e}")
+        
+
 def transform_dictionary_to_pandas(dictionary: dict) -> pd.DataFrame:
     """
     Transforms a dictionary into a pandas DataFrame.
@@ -128,6 +205,22 @@ def transform_dictionary_to_pandas(dictionary: dict) -> pd.DataFrame:
         return pd.DataFrame(dictionary, index=[0])
     except Exception as e:
         raise Exception(f"An error occurred while transforming the dictionary to a DataFrame: {e}")
-    
 
-       
\ No newline at end of file
+
+def get_dictionary_differences(original_dictionary: dict, updated_dictionary: dict) -> dict:
+    """
+    Returns the keys whose values differ between two dictionaries.
+
+    Args:
+        original_dictionary (dict): The dictionary with the original values.
+        updated_dictionary (dict): The dictionary with the updated values.
+
+    Returns:
+        dict: A dictionary mapping each changed key to a tuple (original value, updated value).
+    """
+    try:
+        return {key: (original_dictionary.get(key), value)
+                for key, value in updated_dictionary.items()
+                if original_dictionary.get(key) != value}
+    except Exception as e:
+        raise Exception(f"An error occurred while comparing the dictionaries: {e}")
@@ -0,0 +1,102 @@
+import io
+import os
+import time
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from src.utils.functions import read_csv_file, to_reading_dtype, cast_columns
+
+# The explicit column types of each table; only these columns are read, and the ones missing from a file 
+# (e.g. the optional 'Inherits' column of Role_Security) are skipped.
+TABLE_DTYPES = {
+    'KPI_Data': {'KPI': str, 'KPI_Id': str, 'KPI_Value_Date': str, 'KPI_Values': str},
+    'KPI_Info': {'KPI_Name': str, 'Meta_Data': str},
+    'Role_Security': {'RoleID': 'int64', 'Role': str, 'KPIs': str, 'Inherits': str},
+    'User_Security_Test': {'UserID': 'int64', 'UserName': str, 'RoleID': 'int64'},
+}
+
+def _read_byte_range(path:str, start:int, end:int, columns:List[str], delimiter:str, dtype:dict)->pd.DataFrame:
+    # Parse the complete lines between two byte offsets of the file, using the columns of its header.
+    with open(path, 'rb') as csv_file:
+        csv_file.seek(start)
+        chunk = csv_file.read(end - start)
+    # The pyarrow engine does not match usecols by name without a header, so the columns are selected by position.
+    positions = [columns.index(column) for column in dtype]
+    reading_dtype = to_reading_dtype(dtype)
+    dataframe = pd.read_csv(io.BytesIO(chunk), delimiter=delimiter, header=None, engine='pyarrow', usecols=positions,
+                            dtype={position: reading_dtype[column] for position, column in zip(positions, dtype) if reading_dtype[column] is not None})
+    dataframe.columns = list(dtype)
+    return cast_columns(dataframe=dataframe, dtype=dtype)
+
+def read_csv_file_in_byte_ranges(path:str, delimiter:str='|', dtype:Optional[dict]=None, processes:int=os.cpu_count() or 1)->pd.DataFrame:
+    """
+    Reads a large CSV file with a process pool, each process parsing a byte range of complete lines.
+
+    The file must not have line breaks inside quoted values, since the ranges are split at line breaks.
+
+    Args:
+        path (str): The file path of the CSV file to be read.
+        delimiter (str): The delimiter used in the CSV file (default is '|').
+        dtype (Optional[dict]): The columns to read and their types, or None to read every column.
+        processes (int): The number of processes and byte ranges (default is the number of CPUs).
+
+    Returns:
+        pd.DataFrame: A DataFrame containing the data from the CSV file.
+    """
+    try:
+        with open(path, 'rb') as csv_file:
+            columns = pd.read_csv(io.BytesIO(csv_file.readline()), delimiter=delimiter).columns.tolist()
+            data_start = csv_file.tell()
+            file_size = os.fstat(csv_file.fileno()).st_size
+
+            # Move each boundary to the start of the next line, so no line is split between two ranges.
+            boundaries = [data_start]
+            for part in range(1, processes):
+                csv_file.seek(max(data_start + (file_size - data_start) * part // processes, boundaries[-1]))
+                csv_file.readline()
+                boundaries.append(min(csv_file.tell(), file_size))
+            boundaries.append(file_size)
+
+        dtype = {column: column_type for column, column_type in dtype.items() if column in columns} if dtype else {column: None for column in columns}
+        ranges = [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+        if not ranges:
+            return pd.DataFrame(columns=list(dtype))
+
+        with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+            chunks = list(executor.map(_read_byte_range,
+                                       [path] * len(ranges), [start for start, _ in ranges], [end for _, end in ranges],
+                                       [columns] * len(ranges), [delimiter] * len(ranges), [dtype] * len(ranges)))
+        return pd.concat(chunks, ignore_index=True)
+    except Exception as e:
+        raise Exception(f"An error occurred while reading the CSV file in byte ranges: {e}")
+
+def _timed_read(table:dict, delimiter:str)->Tuple[pd.DataFrame, float]:
+    start = time.perf_counter()
+    dtype = table.get('dtype')
+    if table.get('processes'):
+        dataframe = read_csv_file_in_byte_ranges(path=table['path'], delimiter=delimiter, dtype=dtype, processes=table['processes'])
+    else:
+        dataframe = read_csv_file(path=table['path'], delimiter=delimiter, dtype=dtype, engine='pyarrow')
+    return dataframe, time.perf_counter() - start
+
+def read_csv_files_in_parallel(tables:Dict[str, dict], delimiter:str='|', max_workers:Optional[int]=None)->Tuple[Dict[str, pd.DataFrame], Dict[str, float]]:
+    """
+    Reads several CSV files concurrently with a thread pool, each one with pyarrow's multithreaded CSV reader.
+
+    Args:
+        tables (Dict[str, dict]): A mapping from each table name to its specification: 'path' (required), 
+            'dtype' (the columns to read and their types) and 'processes' (read the file in byte ranges 
+            with that many processes instead).
+        delimiter (str): The delimiter used in the CSV files (default is '|').
+        max_workers (Optional[int]): The number of threads (default is one per table).
+
+    Returns:
+        Tuple[Dict[str, pd.DataFrame], Dict[str, float]]: The DataFrame of each table and the seconds it took to load.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers or len(tables) or 1) as executor:
+        futures = {name: executor.submit(_timed_read, table, delimiter) for name, table in tables.items()}
+        results = {name: future.result() for name, future in futures.items()}
+
+    dataframes = {name: dataframe for name, (dataframe, _) in results.items()}
+    load_times = {name: seconds for name, (_, seconds) in results.items()}
+    return dataframes, load_times